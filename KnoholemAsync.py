@@ -0,0 +1,93 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPException
+from urllib.error import HTTPError
+
+from SPARQLWrapper.SPARQLExceptions import EndPointInternalError
+
+__author__ = 'Diarmuid Ryan'
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncQueryExecutor:
+    """
+    Runs many queries against a source at once on a pool of concurrency threads, so the endpoint is never sent
+    more than concurrency queries at a time. Each thread has its own SPARQLWrapper, see SparqlEndpointSource, but
+    SPARQLWrapper opens a new HTTP connection for every request, so connections are not reused.
+    Failed queries are retried with exponential backoff by the thread which ran them, which keeps its slot,
+    so a struggling endpoint also slows down the queries waiting behind them.
+    """
+
+    def __init__(self, source, concurrency=8, retries=3, backoff=0.5):
+        """
+        :param source: The source the queries are run against. Its query method must be safe to call from
+            several threads, see SparqlEndpointSource
+        :param concurrency: The greatest number of queries in flight at once
+        :param retries: The number of times a failed query is retried
+        :param backoff: The delay in seconds before the first retry, doubled for every further retry
+        """
+        self.source = source
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self._pool = ThreadPoolExecutor(max_workers=concurrency)
+
+    def run(self, queries) -> list:
+        """
+        Runs queries concurrently and waits for all of them
+        :rtype : list
+        :param queries: A list of the queries to be run
+        :return: Returns a list with a (result, seconds, response bytes) tuple for each query, in the order of queries.
+            The result is a dict in the SPARQL 1.1 JSON results format
+        """
+        return list(self._pool.map(self._run_one, queries))
+
+    def close(self):
+        """
+        Stops the threads of the pool
+        :return: None
+        """
+        self._pool.shutdown()
+
+    def _run_one(self, query) -> tuple:
+        """
+        Runs a single query in a thread of the pool, retrying it on failure
+        :rtype : tuple
+        :param query: The query to be run
+        :return: Returns the (result, seconds, response bytes) of the query
+        """
+        attempt = 0
+        while True:
+            try:
+                return self._query(query)
+            except (IOError, HTTPException, EndPointInternalError) as error:
+                if not self._is_retryable(error) or attempt >= self.retries:
+                    raise
+                delay = self.backoff * (2 ** attempt)
+                logger.warning("Query failed ({0:s}), retrying in {1:.1f}s".format(str(error), delay))
+            time.sleep(delay)
+            attempt += 1
+
+    def _query(self, query) -> tuple:
+        """
+        Runs a single query once
+        :rtype : tuple
+        :param query: The query to be run
+        :return: Returns the (result, seconds, response bytes) of the query
+        """
+        start = time.perf_counter()
+        result = self.source.query(query)
+        return result, time.perf_counter() - start, getattr(self.source, "last_response_bytes", None)
+
+    @staticmethod
+    def _is_retryable(error) -> bool:
+        """
+        :rtype : bool
+        :param error: The error a query failed with
+        :return: Returns False for errors which would fail again, such as a malformed query or a missing endpoint
+        """
+        if isinstance(error, HTTPError):
+            return error.code >= 500 or error.code == 429
+        return True
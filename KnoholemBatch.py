@@ -0,0 +1,206 @@
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from KnoholemIfc import KnoholemIfc
+from KnoholemSources import SparqlEndpointSource, LocalGraphSource
+
+__author__ = 'Diarmuid Ryan'
+
+logger = logging.getLogger(__name__)
+
+# Keys of a job in the manifest, any other key of a job is passed to KnoholemIfc as an option
+JOB_KEYS = ("name", "endpoint", "input", "graph", "original_uri", "uri", "output", "output_graph")
+
+
+def load_manifest(filename, output_directory="output") -> list:
+    """
+    Reads a manifest of conversion jobs.
+    The manifest is a JSON list of jobs, or an object with the list under "jobs" and values shared by every job under
+    "defaults". Each job is an object with:
+        graph: the name of the Knoholem graph to convert (required)
+        endpoint: the sparql endpoint the graph is read from and the output is written to
+        input: a Knoholem dump to read the graph from instead of the endpoint
+        original_uri, uri: the uri of the dataset in the input graph and the uri to use for the output
+        output: the output file, output_graph: the name of the output graph
+        and any other option of KnoholemIfc, such as bulk or stream
+    No two jobs may write the same output file, or the same output graph of an endpoint
+    :rtype : list
+    :param filename: The path of the manifest
+    :param output_directory: The directory of the output files of jobs which do not name their own
+    :return: Returns the list of jobs, each a dict with the defaults, its output file and, for jobs with an endpoint,
+        its output graph filled in
+    """
+    with open(filename, "r", encoding="utf-8") as manifest_file:
+        manifest = json.load(manifest_file)
+    defaults = {}
+    if isinstance(manifest, dict):
+        defaults = manifest.get("defaults", {})
+        manifest = manifest.get("jobs", [])
+    jobs = []
+    for index, job in enumerate(manifest):
+        job = dict(defaults, **job)
+        if "graph" not in job:
+            raise ValueError("Job {0:d} of manifest {1:s} has no graph".format(index, filename))
+        if job.get("endpoint") is None and job.get("input") is None:
+            raise ValueError("Job {0:d} of manifest {1:s} has neither an endpoint nor an input".format(index, filename))
+        job.setdefault("name", job["graph"])
+        if job.get("output") is None:
+            job["output"] = KnoholemIfc.default_output_filename(
+                job.get("stream", False) or job.get("state_filename") is not None, job.get("compress", False),
+                output_directory, slug(job["name"]))
+        if job.get("endpoint") is not None and job.get("output_graph") is None:
+            job["output_graph"] = job["graph"] + "_Ifc"
+        jobs.append(job)
+    names = [job["name"] for job in jobs]
+    if len(set(names)) != len(names):
+        raise ValueError("The jobs of manifest {0:s} do not have unique names".format(filename))
+    outputs = [os.path.abspath(job["output"]) for job in jobs]
+    if len(set(outputs)) != len(outputs):
+        raise ValueError("The jobs of manifest {0:s} do not have unique output files".format(filename))
+    output_graphs = [(job["endpoint"], job["output_graph"]) for job in jobs if job.get("endpoint") is not None]
+    if len(set(output_graphs)) != len(output_graphs):
+        raise ValueError("The jobs of manifest {0:s} do not have unique output graphs".format(filename))
+    return jobs
+
+
+def slug(name) -> str:
+    """
+    :rtype : str
+    :param name: The name of a job, usually the URI of its graph
+    :return: Returns the name with everything but letters, digits, '.', '-' and '_' replaced, for use as a file name
+    """
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", name).strip("_")
+
+
+class BatchConverter:
+    """
+    Converts many Knoholem graphs in one process, scheduling the jobs of a manifest over a pool of threads.
+    Jobs reading the same endpoint or dump share one source, so connections and loaded dumps are reused
+    """
+
+    def __init__(self, jobs, workers=4):
+        """
+        :param jobs: The jobs to be run, as returned by load_manifest
+        :param workers: The number of jobs run at once
+        """
+        self.jobs = jobs
+        self.workers = workers
+        self._sources = {}
+        self._lock = threading.Lock()
+
+    def run(self) -> dict:
+        """
+        Runs every job, carrying on past failed jobs
+        :rtype : dict
+        :return: Returns a summary of the run: the totals under "totals" and the result of each job under "jobs"
+        """
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(self.run_job, self.jobs))
+        seconds = time.perf_counter() - start
+        succeeded = [result for result in results if result["status"] == "ok"]
+        rooms = sum(result["rooms"] for result in succeeded)
+        triples = sum(result["triples"] for result in succeeded)
+        totals = {"jobs": len(results), "succeeded": len(succeeded), "failed": len(results) - len(succeeded),
+                  "seconds": seconds, "rooms": rooms, "triples": triples,
+                  "jobs_per_second": len(results) / seconds if seconds else 0.0,
+                  "rooms_per_second": rooms / seconds if seconds else 0.0,
+                  "triples_per_second": triples / seconds if seconds else 0.0}
+        return {"totals": totals, "jobs": results}
+
+    def run_job(self, job) -> dict:
+        """
+        Converts the graph of one job
+        :rtype : dict
+        :param job: The job to be run
+        :return: Returns the result of the job: its status, its output and the throughput of the conversion,
+            or the error it failed with
+        """
+        options = {key: value for key, value in job.items() if key not in JOB_KEYS}
+        output_filename = job["output"]
+        if job.get("original_uri") is not None:
+            options["original_uri"] = job["original_uri"]
+        if job.get("uri") is not None:
+            options["uri_to_use"] = job["uri"]
+        output_graph = job.get("output_graph")
+        result = {"name": job["name"], "graph": job["graph"], "output": output_filename, "output_graph": output_graph}
+        start = time.perf_counter()
+        try:
+            if os.path.dirname(output_filename):
+                os.makedirs(os.path.dirname(output_filename), exist_ok=True)
+            logger.info("Starting job " + job["name"])
+            converter = KnoholemIfc(job.get("endpoint"), job["graph"], source=self._source(job),
+                                    output_filename=output_filename, output_graph_name=output_graph,
+                                    **options)
+        except Exception as error:
+            logger.exception("Job {0:s} failed".format(job["name"]))
+            result.update({"status": "failed", "error": "{0:s}: {1:s}".format(type(error).__name__, str(error)),
+                           "seconds": time.perf_counter() - start})
+            return result
+        seconds = time.perf_counter() - start
+        counters = converter.metrics.counters
+        queries = converter.metrics.to_dict()["query_totals"]
+        result.update({"status": "ok", "seconds": seconds, "rooms": counters.get("rooms", 0),
+                       "sensors": counters.get("sensors", 0), "triples": counters.get("triples", 0),
+                       "queries": queries["count"], "query_seconds": queries["seconds"],
+                       "triples_per_second": counters.get("triples", 0) / seconds if seconds else 0.0})
+        logger.info("Finished job {0:s} in {1:.1f}s".format(job["name"], seconds))
+        return result
+
+    def _source(self, job):
+        """
+        :param job: A job
+        :return: Returns the source the graph of the job is read from, shared with every other job reading the
+            same endpoint or dump
+        """
+        if job.get("input") is not None:
+            key = ("input", job["input"], job["graph"])
+        else:
+            key = ("endpoint", job["endpoint"])
+        with self._lock:
+            source = self._sources.get(key)
+            if source is None:
+                if key[0] == "input":
+                    source = LocalGraphSource(job["input"], job["graph"])
+                else:
+                    source = SparqlEndpointSource(job["endpoint"])
+                self._sources[key] = source
+        return source
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Convert every Knoholem graph of a manifest to IfcOWL")
+    parser.add_argument("manifest", help="JSON file of the jobs, see load_manifest")
+    parser.add_argument("--workers", type=int, default=4, help="jobs run at once")
+    parser.add_argument("--output-directory", default="output",
+                        help="directory of the output files of jobs which do not name their own")
+    parser.add_argument("--summary", help="JSON file the summary of the run is written to")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    summary = BatchConverter(load_manifest(args.manifest, args.output_directory), args.workers).run()
+    if args.summary is not None:
+        with open(args.summary, "w", encoding="utf-8") as summary_file:
+            json.dump(summary, summary_file, indent=2, sort_keys=True)
+    for result in summary["jobs"]:
+        if result["status"] == "ok":
+            print("ok      {0:s}: {1:d} rooms, {2:d} triples in {3:.1f}s -> {4:s}".format(
+                result["name"], result["rooms"], result["triples"], result["seconds"], result["output"]))
+        else:
+            print("FAILED  {0:s}: {1:s}".format(result["name"], result["error"]))
+    totals = summary["totals"]
+    print("{0:d} of {1:d} jobs succeeded in {2:.1f}s, {3:.0f} rooms/s, {4:.0f} triples/s".format(
+        totals["succeeded"], totals["jobs"], totals["seconds"], totals["rooms_per_second"],
+        totals["triples_per_second"]))
+    return 1 if totals["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
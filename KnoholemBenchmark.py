@@ -0,0 +1,193 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from KnoholemIfc import KnoholemIfc
+from KnoholemSources import LocalGraphSource
+
+__author__ = 'Diarmuid Ryan'
+
+BENCHMARK_GRAPH = "http://example.org/benchmark/knoholem"
+
+# The converter options each benchmark mode runs with
+MODES = {
+    "serial": {},
+    "bulk": {"bulk": True},
+    "stream": {"bulk": True, "stream": True},
+    "parallel": {"bulk": True, "stream": True, "workers": 4},
+    "compact": {"bulk": True, "stream": True, "compact": "building"},
+}
+
+# Metrics compared against the baseline, a run is a regression if it is more than tolerance worse
+COMPARED_METRICS = ("total_seconds", "queries", "peak_rss_kb", "output_bytes")
+
+
+def generate_building(filename, rooms, vertices, sensors_per_room, seed=0):
+    """
+    Writes a synthetic Knoholem dataset in Turtle
+    :param filename: The path of the file to be written
+    :param rooms: The number of rooms
+    :param vertices: The number of points in the perimeter of each room
+    :param sensors_per_room: The number of sensors in each room, their types cycle through every type in
+        KnoholemIfc.knoToIfcSensor and one type without an Ifc equivalent
+    :param seed: The seed of the random room sizes and sensor positions
+    :return: None
+    """
+    generator = random.Random(seed)
+    sensor_types = sorted(KnoholemIfc.knoToIfcSensor) + ["MotionSensor"]
+    side = int(math.ceil(math.sqrt(rooms)))
+    sensor_count = 0
+    with open(filename, "w", encoding="utf-8") as out_file:
+        out_file.write("@prefix knoholem: <http://www.semanticweb.org/ontologies/2012/9/knoholem.owl#> .\n")
+        out_file.write("@prefix owl: <http://www.w3.org/2002/07/owl#> .\n")
+        for room_index in range(rooms):
+            centre_x = (room_index % side) * 20.0
+            centre_y = (room_index // side) * 20.0
+            radius = generator.uniform(3.0, 9.0)
+            perimeter = "".join("{0:.3f}:{1:.3f};".format(
+                centre_x + radius * math.cos(2 * math.pi * point / vertices),
+                centre_y + radius * math.sin(2 * math.pi * point / vertices)) for point in range(vertices))
+            out_file.write('knoholem:Room_{0:d} a knoholem:Room, owl:NamedIndividual ;\n'
+                           '    knoholem:hasPerimeter "{1:s}" ;\n'
+                           '    knoholem:hasName "Room {0:d}" .\n'.format(room_index, perimeter))
+            for sensor_index in range(sensors_per_room):
+                sensor_type = sensor_types[sensor_count % len(sensor_types)]
+                out_file.write('knoholem:Sensor_{0:d} a owl:NamedIndividual, knoholem:{1:s} ;\n'
+                               '    knoholem:isSensorOf knoholem:Room_{2:d} ;\n'
+                               '    knoholem:hasName "Sensor {0:d}" ;\n'
+                               '    knoholem:hasPlacement knoholem:Sensor_{0:d}_position .\n'
+                               'knoholem:Sensor_{0:d}_position knoholem:hasXCoord "{3:.3f}" ;\n'
+                               '    knoholem:hasYCoord "{4:.3f}" .\n'.format(
+                                   sensor_count, sensor_type, room_index,
+                                   centre_x + generator.uniform(-radius, radius) / 2,
+                                   centre_y + generator.uniform(-radius, radius) / 2))
+                sensor_count += 1
+
+
+def run_mode(input_filename, output_directory, mode) -> dict:
+    """
+    Runs the full conversion of a dataset in one of the benchmark modes.
+    Meant to be run in a fresh process so that the peak RSS belongs to this mode alone.
+    :rtype : dict
+    :param input_filename: The path of the Knoholem dataset
+    :param output_directory: The directory the output is written to
+    :param mode: The name of the mode in MODES
+    :return: Returns a dict of the measurements of the run
+    """
+    options = MODES[mode]
+    if options.get("stream"):
+        output_filename = os.path.join(output_directory, mode + ".nt")
+    else:
+        output_filename = os.path.join(output_directory, mode + ".n3")
+    start = time.perf_counter()
+    source = LocalGraphSource(input_filename, BENCHMARK_GRAPH)
+    load_seconds = time.perf_counter() - start
+    converter = KnoholemIfc(None, BENCHMARK_GRAPH, source=source, output_filename=output_filename, **options)
+    total_seconds = time.perf_counter() - start
+    metrics = converter.metrics.to_dict()
+    stage_seconds = {"load": load_seconds, "query": metrics["query_totals"]["seconds"]}
+    for stage, timing in metrics["stages"].items():
+        stage_seconds[stage] = timing["seconds"]
+    return {
+        "stage_seconds": stage_seconds,
+        "total_seconds": total_seconds,
+        "queries": metrics["query_totals"]["count"],
+        "result_rows": metrics["query_totals"]["rows"],
+        "triples": metrics["counters"].get("triples", 0),
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "output_bytes": os.path.getsize(output_filename),
+    }
+
+
+def run_benchmark(rooms, vertices, sensors_per_room, modes, seed=0) -> dict:
+    """
+    Generates a synthetic building and converts it once in each mode, every mode in its own process
+    :rtype : dict
+    :param rooms: The number of rooms
+    :param vertices: The number of points in the perimeter of each room
+    :param sensors_per_room: The number of sensors in each room
+    :param modes: The names of the modes in MODES to run
+    :param seed: The seed of the generated building
+    :return: Returns a dict of the benchmark settings and the measurements of each mode
+    """
+    config = {"rooms": rooms, "vertices": vertices, "sensors_per_room": sensors_per_room, "seed": seed}
+    results = {"config": config, "modes": {}}
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as directory:
+        input_filename = os.path.join(directory, "knoholem.ttl")
+        start = time.perf_counter()
+        generate_building(input_filename, rooms, vertices, sensors_per_room, seed)
+        config["generate_seconds"] = time.perf_counter() - start
+        config["input_bytes"] = os.path.getsize(input_filename)
+        for mode in modes:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                results["modes"][mode] = executor.submit(run_mode, input_filename, directory, mode).result()
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance) -> list:
+    """
+    Lists the measurements which are worse than the baseline
+    :rtype : list
+    :param results: The results of run_benchmark
+    :param baseline: Earlier results of run_benchmark with the same settings
+    :param tolerance: The fraction by which a measurement may exceed the baseline
+    :return: Returns a list of descriptions of the regressions
+    """
+    regressions = []
+    for mode, measurements in results["modes"].items():
+        baseline_measurements = baseline["modes"].get(mode)
+        if baseline_measurements is None:
+            continue
+        for metric in COMPARED_METRICS:
+            if measurements[metric] > baseline_measurements[metric] * (1 + tolerance):
+                regressions.append("{0:s} {1:s}: {2} against a baseline of {3}".format(
+                    mode, metric, measurements[metric], baseline_measurements[metric]))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the Knoholem to IfcOWL converter on a synthetic building")
+    parser.add_argument("--rooms", type=int, default=200)
+    parser.add_argument("--vertices", type=int, default=8, help="points in the perimeter of each room")
+    parser.add_argument("--sensors", type=int, default=4, help="sensors in each room")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--modes", default="bulk,stream", help="comma separated, any of " + ",".join(MODES))
+    parser.add_argument("--baseline", help="JSON file of earlier results to check for regressions")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results in the baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.rooms, args.vertices, args.sensors, args.modes.split(","), args.seed)
+    print(json.dumps(results, indent=2, sort_keys=True))
+    if args.baseline is None:
+        return 0
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+        return 0
+    if not os.path.isfile(args.baseline):
+        print("No baseline at {0:s}, run with --save-baseline to store one".format(args.baseline))
+        return 0
+    with open(args.baseline, "r", encoding="utf-8") as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline["config"]["rooms"] != args.rooms or baseline["config"]["vertices"] != args.vertices or \
+            baseline["config"]["sensors_per_room"] != args.sensors:
+        print("The baseline was run on a different building, not comparing")
+        return 0
+    regressions = compare_to_baseline(results, baseline, args.tolerance)
+    for regression in regressions:
+        print("REGRESSION " + regression)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+
+__author__ = 'Diarmuid Ryan'
+
+
+class CachingSource:
+    """
+    Wraps a query source with an on-disk cache of its results.
+    Results are keyed by the normalized query text and a version token of the source graph,
+    so a changed graph never answers from results cached for its old version.
+    The results of a query are kept one binding per line, followed by a line with the list of the query's variables,
+    so they can be read back a row at a time.
+    Each graph has its own subdirectory of the cache directory, holding a directory for each version of the graph,
+    so several graphs can share a cache directory.
+    """
+
+    _version_directory = re.compile(r"^[0-9a-f]{16}$")
+
+    def __init__(self, source, cache_directory, sparql_graph_name, version=None, max_bytes=256 * 1024 * 1024):
+        """
+        :param source: The source to be wrapped
+        :param cache_directory: The directory the results are stored in. Only the subdirectory of the graph
+            is written to
+        :param sparql_graph_name: The name of the graph the queries read
+        :param version: A stamp of the graph's version. Leave empty to ask the source for one, which costs a
+            request to the source, see SparqlEndpointSource.graph_version
+        :param max_bytes: The size the cache is kept under by removing the least recently used results
+        """
+        self.source = source
+        if version is None:
+            version = source.graph_version(sparql_graph_name)
+        graph_directory = os.path.join(cache_directory,
+                                       hashlib.sha1(sparql_graph_name.encode("utf-8")).hexdigest()[:16])
+        version_key = hashlib.sha1(version.encode("utf-8")).hexdigest()[:16]
+        self.directory = os.path.join(graph_directory, version_key)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        os.makedirs(self.directory, exist_ok=True)
+        # Results cached for other versions of the graph can never be used again
+        for entry in os.listdir(graph_directory):
+            entry_path = os.path.join(graph_directory, entry)
+            if entry != version_key and self._version_directory.match(entry) and os.path.isdir(entry_path):
+                shutil.rmtree(entry_path, ignore_errors=True)
+        self._size = sum(os.path.getsize(os.path.join(self.directory, entry))
+                         for entry in os.listdir(self.directory) if entry.endswith(".jsonl"))
+
+    @property
+    def last_response_bytes(self):
+        """
+        :return: Returns the size in bytes of the last response the current thread received from the wrapped source,
+            0 if it was answered from the cache
+        """
+        return getattr(self._local, "last_response_bytes", None)
+
+    @last_response_bytes.setter
+    def last_response_bytes(self, size):
+        self._local.last_response_bytes = size
+
+    def query(self, query) -> dict:
+        """
+        Answers a query from the cache, or from the wrapped source if it has not been seen before
+        :rtype : dict
+        :param query: The query to be run
+        :return: Returns a dict in the SPARQL 1.1 JSON results format
+        """
+        filename = os.path.join(self.directory, self.key(query) + ".jsonl")
+        cache_file = self._open(filename)
+        if cache_file is not None:
+            with cache_file:
+                rows = [json.loads(line) for line in cache_file]
+            return {"head": {"vars": rows.pop()}, "results": {"bindings": rows}}
+        result = self.source.query(query)
+        with self._lock:
+            self.misses += 1
+        self.last_response_bytes = getattr(self.source, "last_response_bytes", None)
+        lines = [json.dumps(binding) + "\n" for binding in result["results"]["bindings"]]
+        lines.append(json.dumps(result["head"]["vars"]) + "\n")
+        self._store(filename, "".join(lines).encode("utf-8"))
+        return result
+
+    def iter_query(self, query):
+        """
+        Answers a query row by row from the cache, or from the wrapped source if it has not been seen before.
+        Rows from the wrapped source are written to the cache as they pass through, and the results are only
+        kept once every row has been read
+        :param query: The query to be run
+        :return: Returns a generator of the bindings of each row, in the SPARQL 1.1 JSON results format
+        """
+        filename = os.path.join(self.directory, self.key(query) + ".jsonl")
+        cache_file = self._open(filename)
+        if cache_file is not None:
+            with cache_file:
+                for line in cache_file:
+                    row = json.loads(line)
+                    # The last line is the list of the variables
+                    if isinstance(row, dict):
+                        yield row
+            return
+        temp_filename = self._temp_filename(filename)
+        complete = False
+        try:
+            with open(temp_filename, "w", encoding="utf-8") as cache_file:
+                variables = []
+                for binding in self.source.iter_query(query):
+                    cache_file.write(json.dumps(binding) + "\n")
+                    for variable in binding:
+                        if variable not in variables:
+                            variables.append(variable)
+                    yield binding
+                # Only the variables which were bound in some row are known
+                cache_file.write(json.dumps(variables) + "\n")
+            complete = True
+        finally:
+            if not complete:
+                os.remove(temp_filename)
+        with self._lock:
+            self.misses += 1
+        self.last_response_bytes = getattr(self.source, "last_response_bytes", None)
+        self._commit(temp_filename, filename)
+
+    def _open(self, filename):
+        """
+        :param filename: The path of the cached results of a query
+        :return: Returns the cached results opened for reading, or None if the query has not been cached
+        """
+        try:
+            cache_file = open(filename, "r", encoding="utf-8")
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(filename)
+        except FileNotFoundError:
+            pass  # evicted since it was opened, the open file can still be read
+        with self._lock:
+            self.hits += 1
+        self.last_response_bytes = 0
+        return cache_file
+
+    def graph_version(self, sparql_graph_name) -> str:
+        """
+        :rtype : str
+        :param sparql_graph_name: The name of the graph
+        :return: Returns the version token of the graph from the wrapped source
+        """
+        return self.source.graph_version(sparql_graph_name)
+
+    @staticmethod
+    def key(query) -> str:
+        """
+        :rtype : str
+        :param query: The text of a query
+        :return: Returns the cache key of the query, which ignores differences in whitespace
+        """
+        return hashlib.sha256(" ".join(query.split()).encode("utf-8")).hexdigest()
+
+    def _store(self, filename, body):
+        temp_filename = self._temp_filename(filename)
+        with open(temp_filename, "wb") as cache_file:
+            cache_file.write(body)
+        self._commit(temp_filename, filename)
+
+    @staticmethod
+    def _temp_filename(filename) -> str:
+        return "{0:s}.{1:d}.tmp".format(filename, threading.get_ident())
+
+    def _commit(self, temp_filename, filename):
+        """
+        Moves fully written results into place and keeps the cache under max_bytes
+        :param temp_filename: The path the results were written to
+        :param filename: The path of the cached results of the query
+        :return: None
+        """
+        size = os.path.getsize(temp_filename)
+        os.replace(temp_filename, filename)
+        with self._lock:
+            self._size += size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """
+        Removes the least recently used results until the cache is back under half of max_bytes.
+        Only committed results are removed, the temporary files of results still being read are left alone
+        :return: None
+        """
+        entries = []
+        for entry in os.listdir(self.directory):
+            if not entry.endswith(".jsonl"):
+                continue
+            path = os.path.join(self.directory, entry)
+            try:
+                entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+            except FileNotFoundError:
+                continue
+        entries.sort()
+        self._size = sum(size for mtime, size, path in entries)
+        for mtime, size, path in entries:
+            if self._size <= self.max_bytes // 2:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
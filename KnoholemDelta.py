@@ -0,0 +1,139 @@
+import gzip
+import hashlib
+import json
+import os
+
+__author__ = 'Diarmuid Ryan'
+
+
+class IncrementalState:
+    """
+    Remembers, between runs, a fingerprint of the source data of every room and the triples it was converted to,
+    so that only rooms whose source data changed have to be converted and published again
+    """
+
+    update_batch_size = 10000  # triples per INSERT DATA / DELETE DATA request
+
+    def __init__(self, filename, settings, compress=False):
+        """
+        :param filename: The JSON file the state is kept in. It is created on the first run
+        :param settings: A dict of the conversion settings. A state saved with other settings is ignored
+        :param compress: If True, gzip the N-Triples file written by write_ntriples
+        """
+        self.filename = filename
+        self.settings = settings
+        self.compress = compress
+        self.previous = {}
+        if os.path.isfile(filename):
+            with open(filename, "r", encoding="utf-8") as state_file:
+                state = json.load(state_file)
+            if state.get("settings") == settings:
+                self.previous = state["rooms"]
+        self.full_rebuild = not self.previous
+        self.rooms = {}
+        self.converted = []
+
+    @staticmethod
+    def fingerprint(result, sensors) -> str:
+        """
+        Fingerprints the source data of a room
+        :rtype : str
+        :param result: The bindings of ?y, ?perim and ?name for the room
+        :param sensors: The room's sensors as returned by KnoholemIfc._group_sensor_bindings
+        :return: Returns a hex digest which changes whenever the perimeter, name or sensors of the room change
+        """
+        source_data = [result["perim"]["value"], result["name"]["value"], sorted(sensors.items())]
+        return hashlib.sha1(json.dumps(source_data, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def is_unchanged(self, room_uri, fingerprint) -> bool:
+        """
+        Checks a room against the previous run, keeping its previous triples if it has not changed
+        :rtype : bool
+        :param room_uri: The full URI of the room in the input graph
+        :param fingerprint: The fingerprint of the room's current source data
+        :return: Returns True if the room does not need to be converted again
+        """
+        previous = self.previous.get(room_uri)
+        if previous is not None and previous["fingerprint"] == fingerprint:
+            self.rooms[room_uri] = previous
+            return True
+        return False
+
+    def record_room(self, room_uri, fingerprint, graph):
+        """
+        Stores the triples a room has just been converted to
+        :param room_uri: The full URI of the room in the input graph
+        :param fingerprint: The fingerprint of the room's source data
+        :type graph: Graph
+        :param graph: A graph holding the triples of this room only
+        :return: None
+        """
+        lines = graph.serialize(format="nt", encoding="utf-8").decode("utf-8").splitlines()
+        self.rooms[room_uri] = {"fingerprint": fingerprint, "triples": sorted(set(line for line in lines if line))}
+        self.converted.append(room_uri)
+
+    def changes(self) -> tuple:
+        """
+        Works out which triples have to be removed from and added to the published graph
+        :rtype : tuple
+        :return: Returns a tuple of the sorted N-Triples lines to be deleted and those to be inserted
+        """
+        current = self._all_triples(self.rooms)
+        previous = self._all_triples(self.previous)
+        deleted = set()
+        for room_uri, room in self.previous.items():
+            if self.rooms.get(room_uri) is not room:
+                deleted.update(room["triples"])
+        inserted = set()
+        for room_uri in self.converted:
+            inserted.update(self.rooms[room_uri]["triples"])
+        return sorted(deleted - current), sorted(inserted - previous)
+
+    def publish(self, publisher):
+        """
+        Brings the published graph up to date. The first run replaces the graph, later runs send only the changes
+        as SPARQL UPDATE DELETE DATA / INSERT DATA requests
+        :type publisher: GraphStorePublisher
+        :param publisher: The publisher of the output graph
+        :return: None
+        """
+        if self.full_rebuild:
+            publisher.delete()
+            publisher.post(self._ntriples(sorted(self._all_triples(self.rooms))), publisher.ntriples_content_type)
+            return
+        deleted, inserted = self.changes()
+        for operation, lines in (("DELETE DATA", deleted), ("INSERT DATA", inserted)):
+            for start in range(0, len(lines), self.update_batch_size):
+                publisher.update("{0:s} {{ GRAPH <{1:s}> {{\n{2:s}\n}} }}".format(
+                    operation, publisher.graph_name, "\n".join(lines[start:start + self.update_batch_size])))
+
+    def write_ntriples(self, filename):
+        """
+        Writes the triples of every room, converted in this run or not, to an N-Triples file, gzipped if compress
+        was set
+        :param filename: The path of the file to be written
+        :return: None
+        """
+        with (gzip.open(filename, "wb") if self.compress else open(filename, "wb")) as out_file:
+            out_file.write(self._ntriples(sorted(self._all_triples(self.rooms))))
+
+    def save(self):
+        """
+        Saves the state of this run for the next one
+        :return: None
+        """
+        temp_filename = self.filename + ".tmp"
+        with open(temp_filename, "w", encoding="utf-8") as state_file:
+            json.dump({"settings": self.settings, "rooms": self.rooms}, state_file)
+        os.replace(temp_filename, self.filename)
+
+    @staticmethod
+    def _all_triples(rooms) -> set:
+        triples = set()
+        for room in rooms.values():
+            triples.update(room["triples"])
+        return triples
+
+    @staticmethod
+    def _ntriples(lines) -> bytes:
+        return "".join(line + "\n" for line in lines).encode("utf-8")
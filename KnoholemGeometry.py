@@ -0,0 +1,61 @@
+from decimal import Decimal, InvalidOperation
+
+__author__ = 'Diarmuid Ryan'
+
+
+def parse_perimeter(perimeter) -> list:
+    """
+    Parses a Knoholem perimeter string in a single pass
+    :rtype : list
+    :param perimeter: A string of coordinates in the form x1:y1;x2:y2;... or x1:y1:z1;x2:y2:z2;...
+        Empty points are skipped and the final point does not need a trailing ;
+    :return: Returns a list with an (x, y, z) tuple of the coordinate strings of each point, z is None for 2D points
+    """
+    points = []
+    for point_string in perimeter.split(";"):
+        point_string = point_string.strip()
+        if not point_string:
+            continue
+        coords = [coord.strip() for coord in point_string.split(":")]
+        if len(coords) not in (2, 3):
+            raise ValueError("Point {0:s} of perimeter {1:s} does not have 2 or 3 coordinates".format(
+                point_string, perimeter))
+        for coord in coords:
+            try:
+                Decimal(coord)
+            except InvalidOperation:
+                raise ValueError("Point {0:s} of perimeter {1:s} has a coordinate which is not a number".format(
+                    point_string, perimeter))
+        if len(coords) == 2:
+            coords.append(None)
+        points.append(tuple(coords))
+    return points
+
+
+def wall_faces(points, height) -> list:
+    """
+    Extrudes each edge of a perimeter into a vertical wall face
+    :rtype : list
+    :param points: The points of the perimeter as returned by parse_perimeter. The last point joins the first
+    :param height: The height of the walls
+    :return: Returns a list with the four (x, y, z) corners of each wall: the two ends of its edge at floor level,
+        then the same two ends in reverse order at the top of the wall. Coordinates are Decimals, except that the
+        z of 2D points is 0 at the floor and height at the top
+    """
+    floor = []
+    top = []
+    for x, y, z in points:
+        x = Decimal(x)
+        y = Decimal(y)
+        if z is None:
+            floor.append((x, y, 0))
+            top.append((x, y, height))
+        else:
+            z = Decimal(z)
+            floor.append((x, y, z))
+            top.append((x, y, z + height))
+    faces = []
+    for index in range(len(points)):
+        next_index = (index + 1) % len(points)
+        faces.append((floor[index], floor[next_index], top[next_index], top[index]))
+    return faces
@@ -1,22 +1,36 @@
-import copy
+import itertools
+import logging
 import os
+import time
 import sys
-import subprocess
-from decimal import Decimal
 from urllib.request import ProxyHandler, build_opener, install_opener
 from builtins import range
+from concurrent.futures import ProcessPoolExecutor
+from http.client import HTTPException
 
 from rdflib import Graph, RDF, URIRef, Namespace, Literal
-from SPARQLWrapper import SPARQLWrapper, JSON
 # from KnoIfc.KnoholemVis import KnoholemVisual
-from rdflib.resource import Resource
+
+from KnoholemSources import SparqlEndpointSource, LocalGraphSource
+from KnoholemCache import CachingSource
+from KnoholemAsync import AsyncQueryExecutor
+from KnoholemOutput import NTriplesStreamWriter, TripleEmitter
+from KnoholemPublish import GraphStorePublisher
+from KnoholemDelta import IncrementalState
+from KnoholemGeometry import parse_perimeter, wall_faces
+from KnoholemMetrics import Instrumentation
+from KnoholemOntology import OntologyIndex
 
 __author__ = 'Diarmuid Ryan'
 
+logger = logging.getLogger(__name__)
+
 
 class KnoholemIfc:
     HEIGHT_OF_WALLS = 2
 
+    all_rooms_batch_size = 500  # rooms converted per batch when batch_size is None and every sensor is fetched at once
+
     sparql_prefix = """PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
         PREFIX knoholem: <http://www.semanticweb.org/ontologies/2012/9/knoholem.owl#>
         PREFIX owl: <http://www.w3.org/2002/07/owl#>"""
@@ -32,49 +46,282 @@ class KnoholemIfc:
     cart_ns = Namespace("http://purl.org/net/cartCoord#")
     rdfs = Namespace("http://www.w3.org/2000/01/rdf-schema#")
 
+    owl_named_individual = "http://www.w3.org/2002/07/owl#NamedIndividual"
+
+    # Terms used for every room, built once instead of once per triple
+    xsd_double = URIRef("http://www.w3.org/2001/XMLSchema#double")
+    rdfs_label = rdfs.label
+    cart_point_list = cart_ns.Point_List
+    cart_point = cart_ns.Point
+    cart_has_placement = cart_ns.hasPlacement
+    cart_has_point = cart_ns.hasPoint
+    cart_xcoord = cart_ns.xcoord
+    cart_ycoord = cart_ns.ycoord
+    cart_zcoord = cart_ns.zcoord
+    ifc_space = ifc_ns.IfcSpace
+    ifc_rel_contained = ifc_ns.IfcRelContainedInSpatialStructure
+    ifc_relating_structure = ifc_ns.RelatingStructure_of_IfcRelContainedInSpatialStructure
+    ifc_related_elements = ifc_ns.RelatedElements_of_IfcRelContainedInSpatialStructure
+    ifc_space_boundary = ifc_ns.IfcRelSpaceBoundary2ndLevel
+    ifc_relating_space = ifc_ns.RelatingSpace
+    ifc_wall = ifc_ns.IfcWallStandardCase
+    ifc_related_building_element = ifc_ns.RelatedBuildingElement
+    ifc_inner_boundaries = ifc_ns.InnerBoundaries
+    ifc_parent_boundary = ifc_ns.ParentBoundary
+    ifc_connection_surface_geometry = ifc_ns.IfcConnectionSurfaceGeometry
+    ifc_connection_geometry = ifc_ns.ConnectionGeometry
+    ifc_curve_bounded_plane = ifc_ns.IfcCurveBoundedPlane
+    ifc_surface_on_relating_element = ifc_ns.SurfaceOnRelatingElement
+    ifc_polyline = ifc_ns.IfcPolyline
+    ifc_outer_boundary = ifc_ns.OuterBoundary
+    ifc_points = ifc_ns.Points
+    ifc_cartesian_point_list = ifc_ns.IfcCartesianPoint_List
+    ifc_cartesian_point = ifc_ns.IfcCartesianPoint
+    ifc_coordinates = ifc_ns.Coordinates
+    ifc_length_measure_list = ifc_ns.IfcLengthMeasure_List
+    ifc_length_measure = ifc_ns.IfcLengthMeasure
+    ifc_has_next = ifc_ns.hasNext
+    ifc_has_list_content = ifc_ns.hasListContent
+    ifc_sensor_predefined_type = ifc_ns.PredefinedType_of_IfcSensor
+    ifc_flow_meter_predefined_type = ifc_ns.PredefinedType_of_IfcFlowMeter
+
     def __init__(self, sparql_endpoint_url, sparql_graph_name,
                  original_uri="http://www.semanticweb.org/ontologies/2012/9/knoholem.owl#",
-                 uri_to_use="http://something/example/"):
+                 uri_to_use="http://something/example/", bulk=False, batch_size=500,
+                 source=None, stream=False, compress=False, output_filename=None,
+                 state_filename=None, workers=1, metrics_filename=None, profile=False, trace_memory=False,
+                 cache_directory=None, cache_version=None, stream_results=False,
+                 concurrency=1, output_graph_name=None, compact=None, validate=False):
         """
         Setup the KnoholemIfc class.
-        :param sparql_endpoint_url: The URL of the sparql endpoint to be used for all sparql operations
+        :param sparql_endpoint_url: The URL of the sparql endpoint to be used for all sparql operations.
+            None skips writing the output to fuseki, for use with an offline source
         :param sparql_graph_name: The URL of the sparql graph to take input from. Output = sparql_graph_name + "_Ifc"
         :param original_uri: The uri of the dataset in the input graph
         :param uri_to_use: The uri to use for the output dataset
+        :param bulk: If True, fetch the sensors of many rooms per query instead of querying room by room
+        :param batch_size: The number of rooms whose sensors are fetched per query in bulk mode.
+            None fetches the sensors of every room in a single query
+        :param source: The backend the input graph is queried through, e.g. a LocalGraphSource.
+            Leave empty to query sparql_endpoint_url
+        :param stream: If True, write N-Triples room by room instead of building the whole graph and writing N3
+        :param compress: If True, gzip the N-Triples file written when streaming or converting incrementally,
+            and the data uploaded to fuseki. The N3 output of a full conversion is never gzipped
+        :param output_filename: The file to write the output to.
+            Defaults to output/knoholemifc.n3, or output/knoholemifc.nt when streaming or converting incrementally,
+            output/knoholemifc.nt.gz if compress is also set
+        :param state_filename: If given, convert incrementally: only rooms whose perimeter, name or sensors changed
+            since the run which saved this file are converted, and only the changed triples are sent to fuseki.
+            A file saved with other settings, another endpoint or another output graph starts a full conversion.
+            The output file is written as N-Triples. Can not be combined with stream
+        :param workers: The number of processes rooms are converted in. More than one implies bulk
+        :param metrics_filename: If given, write the timings and counters of the run to this JSON file.
+            They are also available afterwards as self.metrics
+        :param profile: If True, profile the run with cProfile and include the slowest functions in the metrics
+        :param trace_memory: If True, trace the run with tracemalloc and include its peak and top allocations
+            in the metrics
+        :param cache_directory: If given, keep the results of the queries in this directory and answer repeated
+            queries from it, as long as the input graph has not changed
+        :param cache_version: A stamp of the input graph's version for the cache. Leave empty to ask the source,
+            which costs one request
+        :param stream_results: If True, read the results of each query row by row as they arrive and start converting
+            rooms on the first rows, instead of loading every response whole before converting anything
+        :param concurrency: The number of sensor queries sent to the source at once. More than one runs the sensor
+            queries of a batch of rooms concurrently, retrying failed queries, then converts the rooms in their
+            usual order. The source must be safe to query from several threads
+        :param output_graph_name: The name of the fuseki graph the output is written to.
+            Defaults to sparql_graph_name + "_Ifc"
+        :param compact: Write each distinct wall corner once, as an IfcCartesianPoint with its IfcLengthMeasure_List
+            coordinates shared by every wall face which uses it, instead of once per face. "room" shares them
+            within each room, "building" across the whole building. None writes every corner of every face.
+            Each face still has its own IfcCartesianPoint_List cells. "building" can not be combined with workers
+        :param validate: If True, check every emitted class, property and enumeration value against
+            resources/IFC4_ADD1.owl and log the ones it does not define. They are also counted in the metrics
         """
+        if state_filename is not None and stream:
+            raise ValueError("Incremental conversion can not be combined with streaming output")
+        if compact not in (None, "room", "building"):
+            raise ValueError("compact must be None, room or building, not {0:s}".format(str(compact)))
+        if state_filename is not None and compact == "building":
+            raise ValueError("Incremental conversion can not share geometry across rooms, use compact=room")
+        if workers > 1 and compact == "building":
+            raise ValueError("Rooms converted in several processes can not share geometry, use compact=room")
         proxy = ProxyHandler({})
         opener = build_opener(proxy)
         install_opener(opener)
 
         self.sparql_endpoint = sparql_endpoint_url
-        print("Loading IFC Ontology")
-        print(sparql_endpoint_url)
-        self.sparql = SPARQLWrapper(sparql_endpoint_url)
+        self.metrics = Instrumentation(profile, trace_memory)
+        self.ontology = None
+        if validate:
+            logger.info("Loading IFC Ontology")
+            self.ontology = OntologyIndex.load()
+        logger.info(sparql_endpoint_url)
+        if source is None:
+            source = SparqlEndpointSource(sparql_endpoint_url)
+        if cache_directory is not None:
+            source = CachingSource(source, cache_directory, sparql_graph_name, cache_version)
+        self.source = source
+        self.query_executor = None
+        if concurrency > 1:
+            self.query_executor = AsyncQueryExecutor(source, concurrency)
         self.sparql_graph = sparql_graph_name
         self.sparql_graph_uri = original_uri
+        self.bulk = bulk or state_filename is not None or workers > 1
+        self.batch_size = batch_size
+        self.workers = workers
+        self.stream_results = stream_results
+        self.compact = compact
+        self._setup_output(uri_to_use)
+        output_sparql_graph_name = output_graph_name
+        if output_sparql_graph_name is None:
+            output_sparql_graph_name = sparql_graph_name + "_Ifc"
+        if output_filename is None:
+            output_filename = self.default_output_filename(stream or state_filename is not None, compress)
+        self.incremental = None
+        if state_filename is not None:
+            # The state describes the graph it was published to, so an offline run or a run publishing elsewhere
+            # starts the next run from scratch
+            settings = {"sparql_graph": sparql_graph_name, "original_uri": original_uri, "uri_to_use": uri_to_use,
+                        "height_of_walls": self.HEIGHT_OF_WALLS, "endpoint": sparql_endpoint_url,
+                        "output_graph": output_sparql_graph_name if sparql_endpoint_url is not None else None}
+            if compact is not None:
+                settings["compact"] = compact
+            self.incremental = IncrementalState(state_filename, settings, compress)
+        self.room_sinks = []
+        if stream:
+            self.room_sinks.append(NTriplesStreamWriter(output_filename, compress))
+        publisher = None
+        if sparql_endpoint_url is not None:
+            publisher = GraphStorePublisher(sparql_endpoint_url, output_sparql_graph_name, compress)
+            if stream:
+                logger.info("Writing converted data to fuseki graph: " + output_sparql_graph_name +
+                            ", once every room has been converted")
+                try:
+                    publisher.start()
+                except (IOError, HTTPException):
+                    for sink in self.room_sinks:
+                        sink.abort()
+                    raise
+                self.room_sinks.append(publisher)
+        # self.visualize = KnoholemVisual(self.sparql_prefix, self.sparql, self.sparql_graph, output_sparql_graph_name)
+        self.metrics.start()
+        logger.info("Starting conversion process")
+        # The profiler and memory tracing are stopped however the run ends, tracemalloc traces the whole process
+        try:
+            try:
+                with self.metrics.stage("convert"):
+                    self.convert()
+            except BaseException:
+                # Leave fuseki as it was and release the output file
+                for sink in self.room_sinks:
+                    sink.abort()
+                raise
+            finally:
+                if self.query_executor is not None:
+                    self.query_executor.close()
+            for term, invalid in sorted(self.metrics.invalid_terms.items()):
+                logger.warning("{0:s} is {1:s}, emitted {2:d} times".format(term, invalid["reason"],
+                                                                            invalid["count"]))
+            # self.visualize.close()
+            self._write_output(output_filename, publisher, output_sparql_graph_name)
+            if cache_directory is not None:
+                self.metrics.count("cache_hits", self.source.hits)
+                self.metrics.count("cache_misses", self.source.misses)
+        finally:
+            self.metrics.stop()
+        if metrics_filename is not None:
+            self.metrics.write_json(metrics_filename)
+        logger.info("Finished")
+
+    @staticmethod
+    def default_output_filename(ntriples, compress, directory="output", name="knoholemifc") -> str:
+        """
+        :rtype : str
+        :param ntriples: True if the output is written as N-Triples, when streaming or converting incrementally
+        :param compress: True if N-Triples output is gzipped
+        :param directory: The directory of the output file
+        :param name: The name of the output file, without its extension
+        :return: Returns the path the output is written to when no output_filename is given
+        """
+        if not ntriples:
+            return os.path.join(directory, name + ".n3")
+        elif compress:
+            return os.path.join(directory, name + ".nt.gz")
+        else:
+            return os.path.join(directory, name + ".nt")
+
+    def _write_output(self, output_filename, publisher, output_sparql_graph_name):
+        """
+        Writes the converted data to file and to fuseki, once every room has been converted
+        :param output_filename: The file to write the output to
+        :type publisher: GraphStorePublisher
+        :param publisher: The publisher of the output graph, None to not write to fuseki
+        :param output_sparql_graph_name: The name of the output graph
+        :return: None
+        """
+        if self.room_sinks:
+            with self.metrics.stage("write"):
+                for sink in self.room_sinks:
+                    sink.close()
+        elif self.incremental is not None:
+            logger.info("Converted {0:d} changed rooms, writing converted data to file".format(
+                len(self.incremental.converted)))
+            with self.metrics.stage("write"):
+                self.incremental.write_ntriples(output_filename)
+            if publisher is not None:
+                logger.info("Writing changes to fuseki graph: " + output_sparql_graph_name)
+                with self.metrics.stage("upload"):
+                    self.incremental.publish(publisher)
+                    publisher.close()
+            self.incremental.save()
+        else:
+            logger.info("Writing converted data to file")
+            with self.metrics.stage("write"):
+                output_file = open(output_filename, "wb")
+                self.out_graph.serialize(destination=output_file, format='n3', auto_compact=True)
+                output_file.close()
+            if publisher is not None:
+                logger.info("Writing converted data to fuseki graph: " + output_sparql_graph_name)
+                with self.metrics.stage("upload"):
+                    publisher.delete()
+                    logger.info("Old graph deleted, adding new graph")
+                    publisher.put_file(output_filename, publisher.n3_content_type)
+                    publisher.close()
+
+    def _setup_output(self, uri_to_use):
+        """
+        Creates the empty output graph
+        :param uri_to_use: The uri to use for the output dataset
+        :return: None
+        """
         self.out_ns = Namespace(uri_to_use)
         self.out_graph = Graph(identifier=uri_to_use)
         self.out_graph.namespace_manager.bind("ifc", self.ifc_ns)
         self.out_graph.namespace_manager.bind("cart", self.cart_ns)
         self.out_graph.namespace_manager.bind("rdfs", self.rdfs)
         self.out_graph.namespace_manager.bind("", self.out_ns)
-        output_sparql_graph_name = sparql_graph_name + "_Ifc"
-        # self.visualize = KnoholemVisual(self.sparql_prefix, self.sparql, self.sparql_graph, output_sparql_graph_name)
-        print("Starting conversion process")
-        self.convert()
-        # self.visualize.close()
-        print("Writing converted data to file")
-        output_filename = os.path.join("output", "knoholemifc.n3")
-        output_file = open(output_filename, "wb")
-        self.out_graph.serialize(destination=output_file, format='n3', auto_compact=True)
-        output_file.close()
-        print("Writing converted data to fuseki graph: " + output_sparql_graph_name)
-        subprocess.call("ruby {2} {0} {1}".format(sparql_endpoint_url, output_sparql_graph_name,
-                                                  os.path.join("fuseki", "s-delete")))
-        print("Old graph deleted, adding new graph")
-        subprocess.call("ruby {3} {0} {1} {2}".format(sparql_endpoint_url, output_sparql_graph_name,
-                                                      output_filename, os.path.join("fuseki", "s-put")))
-        print("Finished")
+        self.emitter = TripleEmitter(self.out_graph)
+        self._length_measures = {}
+        self._shared_nodes = set()
+
+    @classmethod
+    def _room_converter(cls, original_uri, uri_to_use, compact=None, validate=False):
+        """
+        Creates a converter which only converts the rooms it is given, for use in worker processes
+        :param original_uri: The uri of the dataset in the input graph
+        :param uri_to_use: The uri to use for the output dataset
+        :param compact: The compact option of the converter, see __init__
+        :param validate: The validate option of the converter, see __init__
+        :return: Returns a KnoholemIfc on which _emit_room can be called
+        """
+        converter = cls.__new__(cls)
+        converter.sparql_graph_uri = original_uri
+        converter.compact = compact
+        converter.ontology = OntologyIndex.load() if validate else None
+        converter._setup_output(uri_to_use)
+        converter.metrics = Instrumentation()
+        return converter
 
     def run_sparql_query(self, query) -> dict:
         """
@@ -83,9 +330,65 @@ class KnoholemIfc:
             :param query: The query to be run
             :return: Returns a dict containing the return of the sparql query
             """
-        self.sparql.setQuery(query)
-        self.sparql.setReturnFormat(JSON)
-        return self.sparql.query().convert()
+        start = time.perf_counter()
+        result = self.source.query(query)
+        self.metrics.record_query(query, time.perf_counter() - start, len(result["results"]["bindings"]),
+                                  getattr(self.source, "last_response_bytes", None))
+        return result
+
+    def run_sparql_queries(self, queries) -> list:
+        """
+            Runs many sparql queries, concurrently if a concurrency was given
+            :rtype : list
+            :param queries: A list of the queries to be run
+            :return: Returns a list holding the list of bindings of each query, in the order of queries
+            """
+        if self.query_executor is None:
+            return [self.run_sparql_query(query)["results"]["bindings"] for query in queries]
+        out = []
+        for query, (result, seconds, size) in zip(queries, self.query_executor.run(queries)):
+            self.metrics.record_query(query, seconds, len(result["results"]["bindings"]), size)
+            out.append(result["results"]["bindings"])
+        return out
+
+    def iter_sparql_query(self, query):
+        """
+            Runs a sparql query, yielding its rows one at a time.
+            When streaming results, rows are read from the source as they are asked for
+            :param query: The query to be run
+            :return: Returns a generator of the bindings of each row of the query
+            """
+        if not self.stream_results:
+            yield from self.run_sparql_query(query)["results"]["bindings"]
+            return
+        rows = self.source.iter_query(query)
+        seconds = 0.0
+        row_count = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                binding = next(rows)
+            except StopIteration:
+                break
+            finally:
+                seconds += time.perf_counter() - start
+            row_count += 1
+            yield binding
+        self.metrics.record_query(query, seconds, row_count, getattr(self.source, "last_response_bytes", None))
+
+    @staticmethod
+    def _batches(rows, batch_size):
+        """
+        Splits rows into lists of batch_size rows, without reading further ahead than one batch
+        :param rows: An iterable of rows
+        :param batch_size: The number of rows in each batch
+        :return: Returns a generator of lists of rows
+        """
+        rows = iter(rows)
+        batch = list(itertools.islice(rows, batch_size))
+        while batch:
+            yield batch
+            batch = list(itertools.islice(rows, batch_size))
 
     def strip_uri(self, to_be_stripped, url=None) -> str:
         """
@@ -100,7 +403,7 @@ class KnoholemIfc:
         if url in to_be_stripped:
             return to_be_stripped[len(url):]
         else:
-            print("ERROR, {1:s} is not in {0:s}".format(to_be_stripped, url))
+            logger.error("{1:s} is not in {0:s}".format(to_be_stripped, url))
 
     def convert(self):
         """
@@ -115,161 +418,421 @@ class KnoholemIfc:
                 ?y knoholem:hasPerimeter ?perim .
                 ?y knoholem:hasName ?name
             }}""".format(self.sparql_prefix, self.sparql_graph)
-        results = self.run_sparql_query(query)
-        for result in results["results"]["bindings"]:
-            qualified_room_name = result["y"]["value"]
-            room_name = self.strip_uri(qualified_room_name)
-            room = self.out_graph.resource(self.out_ns + room_name)
-            self._add_room_placement_cart_coord(room, str(result["perim"]["value"]), room_name)
-            room.set(RDF.type, URIRef(self.ifc_ns.IfcSpace))
-            room_label = Literal(result["name"]["value"])
-            room.set(self.rdfs.label, room_label)
-            # self.visualize.put_room(qualified_room_name, str(room.identifier))
-            contained_in_room = self.out_graph.resource(self.out_ns + "Contained_In_" + room_name)
-            contained_in_room.set(RDF.type, URIRef(self.ifc_ns.IfcRelContainedInSpatialStructure))
-            contained_in_room.set(self.ifc_ns.RelatingStructure_of_IfcRelContainedInSpatialStructure, room)
-            self._add_room_placement_ifc_full(room, str(result["perim"]["value"]), room_name, contained_in_room)
-            self.convert_sensors(contained_in_room, qualified_room_name)
-
-    def _add_room_placement_cart_coord(self, place: Resource, perimeter: str, place_name: str):
-        """
-        This method adds the coordinates of an individual given a string of the perimeter coordinates
+        rooms = self.iter_sparql_query(query)
+        executor = None
+        if self.workers > 1:
+            executor = ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            for batch in self._room_batches(rooms):
+                if executor is None:
+                    for result, room_sensors in batch:
+                        self._convert_room(result, room_sensors)
+                else:
+                    self._convert_rooms_parallel(executor, batch)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+    def _room_batches(self, rooms):
+        """
+        Pairs the rows of the room query with the sensors of their rooms, a batch of rooms at a time
+        :param rooms: An iterable of rows of the room query
+        :return: Returns a generator of lists of (room query row, sensors of the room) tuples. The sensors are None
+            when each room is to query its own
+        """
+        if not self.bulk and self.query_executor is None:
+            for result in rooms:
+                yield [(result, None)]
+            return
+        batches = self._batches(rooms, self.batch_size or self.all_rooms_batch_size)
+        all_sensors = None
+        if self.bulk and not self.batch_size:
+            all_sensors = self._get_sensors_bulk()
+        if self.bulk and self.batch_size and self.query_executor is not None:
+            # Fetch the sensors of the next few batches at once
+            batch_groups = self._batches(batches, self.query_executor.concurrency)
+        else:
+            batch_groups = ([batch] for batch in batches)
+        for group in batch_groups:
+            room_names = [[result["y"]["value"] for result in batch] for batch in group]
+            if all_sensors is not None:
+                group_sensors = [all_sensors]
+            elif not self.bulk:
+                group_sensors = [self._get_sensors_concurrent(room_names[0])]
+            elif self.query_executor is None:
+                group_sensors = [self._get_sensors_bulk(room_names[0])]
+            else:
+                group_sensors = [self._group_bulk_sensor_bindings(bindings) for bindings in self.run_sparql_queries(
+                    [self._sensors_bulk_query(batch_room_names) for batch_room_names in room_names])]
+            for batch, batch_room_names, sensors in zip(group, room_names, group_sensors):
+                yield [(result, sensors.get(room_name, {})) for result, room_name in zip(batch, batch_room_names)]
+
+    def _convert_rooms_parallel(self, executor, rooms):
+        """
+        Converts rooms in the worker processes of executor, then merges their triples in the order of rooms
+        so the output is the same as when converting serially
+        :type executor: ProcessPoolExecutor
+        :type rooms: list
+        :param executor: The pool of worker processes
+        :param rooms: A list of (room query row, sensors of the room) tuples
+        :return: None
+        """
+        pending = []
+        for result, sensors in rooms:
+            fingerprint = None
+            if self.incremental is not None:
+                fingerprint = self.incremental.fingerprint(result, sensors)
+                if self.incremental.is_unchanged(result["y"]["value"], fingerprint):
+                    continue
+            pending.append((result, sensors, fingerprint))
+        # Rooms which only go to the streaming sinks are serialized by the workers and never rebuilt here
+        as_ntriples = self.incremental is None and bool(self.room_sinks)
+        chunk_size = max(1, -(-len(pending) // (self.workers * 4)))
+        chunks = [(self.sparql_graph_uri, str(self.out_ns), self.compact, self.ontology is not None, as_ntriples,
+                   [(result, sensors) for result, sensors, fingerprint in pending[start:start + chunk_size]])
+                  for start in range(0, len(pending), chunk_size)]
+        room_outputs = self._merge_room_outputs(executor.map(_emit_rooms, chunks))
+        for (result, sensors, fingerprint), room_output in zip(pending, room_outputs):
+            if as_ntriples:
+                self.metrics.record_room(self.strip_uri(result["y"]["value"]), room_output.count(b"\n"))
+                for sink in self.room_sinks:
+                    sink.write_ntriples(room_output)
+            else:
+                self.metrics.record_room(self.strip_uri(result["y"]["value"]), len(room_output))
+                self.out_graph.addN((s, p, o, self.out_graph) for s, p, o in room_output)
+                self._finish_room(result["y"]["value"], fingerprint)
+
+    def _merge_room_outputs(self, chunk_outputs):
+        """
+        :param chunk_outputs: An iterable of the return values of _emit_rooms
+        :return: Returns a generator of the output of each room, recording the invalid terms found by the workers
+        """
+        for room_outputs, invalid_terms in chunk_outputs:
+            for term, invalid in invalid_terms.items():
+                self.metrics.record_invalid_term(term, invalid["reason"], invalid["count"])
+            yield from room_outputs
+
+    def _convert_room(self, result, sensors=None):
+        """
+        Converts a single room, given one row of the room query
+        :type result: dict
+        :type sensors: dict
+        :param result: The bindings of ?y, ?perim and ?name for the room
+        :param sensors: The room's sensors as returned by _group_sensor_bindings.
+            Leave empty to query the sensors of this room individually
+        :return: None
+        """
+        fingerprint = None
+        if self.incremental is not None:
+            fingerprint = self.incremental.fingerprint(result, sensors)
+            if self.incremental.is_unchanged(result["y"]["value"], fingerprint):
+                return
+        self._emit_room(result, sensors)
+        self._finish_room(result["y"]["value"], fingerprint)
+
+    def _emit_room(self, result, sensors=None):
+        """
+        Adds the triples of a single room to out_graph
+        :type result: dict
+        :type sensors: dict
+        :param result: The bindings of ?y, ?perim and ?name for the room
+        :param sensors: The room's sensors as returned by _group_sensor_bindings.
+            Leave empty to query the sensors of this room individually
+        :return: None
+        """
+        qualified_room_name = result["y"]["value"]
+        room_name = self.strip_uri(qualified_room_name)
+        emit = self.emitter.emit
+        room = URIRef(self.out_ns + room_name)
+        with self.metrics.stage("geometry"):
+            points = parse_perimeter(str(result["perim"]["value"]))
+            self._add_room_placement_cart_coord(room, points, room_name)
+        emit((room, RDF.type, self.ifc_space))
+        emit((room, self.rdfs_label, Literal(result["name"]["value"])))
+        # self.visualize.put_room(qualified_room_name, str(room))
+        contained_in_room = URIRef(self.out_ns + "Contained_In_" + room_name)
+        emit((contained_in_room, RDF.type, self.ifc_rel_contained))
+        emit((contained_in_room, self.ifc_relating_structure, room))
+        with self.metrics.stage("geometry"):
+            self._add_room_placement_ifc_full(room, points, room_name, contained_in_room)
+        with self.metrics.stage("sensors"):
+            if sensors is None:
+                self.convert_sensors(contained_in_room, qualified_room_name)
+            else:
+                for sensor_name_uri, sensor_data in sensors.items():
+                    self._add_sensor(contained_in_room, sensor_name_uri, sensor_data)
+        self.metrics.record_room(room_name, len(self.emitter.triples))
+        if self.ontology is not None:
+            for term, reason in self.ontology.unknown_terms(self.emitter.triples):
+                self.metrics.record_invalid_term(term, reason)
+        self.emitter.flush()
+
+    def _finish_room(self, qualified_room_name, fingerprint):
+        """
+        Records and flushes the triples of a room once it has been added to out_graph
+        :param qualified_room_name: The full URI of the room in the input graph
+        :param fingerprint: The fingerprint of the room's source data when converting incrementally, otherwise None
+        :return: None
+        """
+        if self.incremental is not None:
+            self.incremental.record_room(qualified_room_name, fingerprint, self.out_graph)
+        self._flush_room()
+
+    def _flush_room(self):
+        """
+        When streaming, hands the triples of the room just converted to the output file and fuseki.
+        Empties out_graph, and forgets the coordinate literals of the room, when streaming or converting incrementally
+        :return: None
+        """
+        if self.room_sinks or self.incremental is not None:
+            if self.room_sinks:
+                room_output = self.out_graph.serialize(format="nt", encoding="utf-8")
+                for sink in self.room_sinks:
+                    sink.write_ntriples(room_output)
+            self.out_graph.remove((None, None, None))
+            self._length_measures.clear()
+
+    def _get_sensors_bulk(self, qualified_room_names=None) -> dict:
+        """
+        Fetches the type, name and placement of the sensors of many rooms in one query
+        :rtype : dict
+        :param qualified_room_names: The full URIs of the rooms whose sensors are wanted.
+            Leave empty to fetch the sensors of every room in the graph
+        :return: Returns a dict of room URI to the sensors of that room, see _group_sensor_bindings
+        """
+        return self._group_bulk_sensor_bindings(
+            self.iter_sparql_query(self._sensors_bulk_query(qualified_room_names)))
+
+    def _get_sensors_concurrent(self, qualified_room_names) -> dict:
+        """
+        Fetches the sensors of many rooms with the same queries as convert_sensors, running the queries of
+        every room at once
+        :rtype : dict
+        :param qualified_room_names: The full URIs of the rooms whose sensors are wanted
+        :return: Returns a dict of room URI to the sensors of that room, see _group_sensor_bindings
+        """
+        sensor_names = [[each["y"]["value"] for each in bindings] for bindings in self.run_sparql_queries(
+            [self._sensor_list_query(qualified_room_name) for qualified_room_name in qualified_room_names])]
+        sensor_bindings = iter(self.run_sparql_queries(
+            [self._sensor_query(sensor_name_uri) for names in sensor_names for sensor_name_uri in names]))
+        rooms = {}
+        for qualified_room_name, names in zip(qualified_room_names, sensor_names):
+            sensors = rooms[qualified_room_name] = {}
+            for sensor_name_uri in names:
+                grouped = self._group_sensor_bindings(
+                    (qualified_room_name, sensor_name_uri, binding) for binding in next(sensor_bindings))
+                sensors[sensor_name_uri] = grouped[qualified_room_name][sensor_name_uri]
+        return rooms
+
+    def _sensors_bulk_query(self, qualified_room_names=None) -> str:
+        """
+        :rtype : str
+        :param qualified_room_names: The full URIs of the rooms whose sensors are wanted.
+            Leave empty to fetch the sensors of every room in the graph
+        :return: Returns the query of the type, name and placement of the sensors of the rooms
+        """
+        if qualified_room_names is None:
+            room_filter = "?room rdf:type knoholem:Room ."
+        else:
+            room_filter = "VALUES ?room {{ {0:s} }}".format(
+                " ".join("<" + room_name + ">" for room_name in qualified_room_names))
+        return u"""{0:s}
+            SELECT ?room ?sensor ?type ?x ?y ?name
+            FROM <{1:s}>
+            WHERE {{
+                {2:s}
+                ?sensor knoholem:isSensorOf ?room .
+                ?sensor rdf:type ?type .
+                ?sensor knoholem:hasName ?name .
+                ?sensor knoholem:hasPlacement ?pos .
+                ?pos knoholem:hasXCoord ?x .
+                ?pos knoholem:hasYCoord ?y
+            }}""".format(self.sparql_prefix, self.sparql_graph, room_filter)
+
+    def _group_bulk_sensor_bindings(self, bindings) -> dict:
+        """
+        :rtype : dict
+        :param bindings: An iterable of the bindings of the rows of a query made by _sensors_bulk_query
+        :return: Returns a dict of room URI to the sensors of that room, see _group_sensor_bindings
+        """
+        return self._group_sensor_bindings(
+            (binding["room"]["value"], binding["sensor"]["value"], binding) for binding in bindings)
+
+    def _group_sensor_bindings(self, rows) -> dict:
+        """
+        Groups the rows of a sensor query by room and sensor.
+        A sensor appears once per rdf:type it has; owl:NamedIndividual is dropped from the types and the name
+        and coordinates are taken from the first row of each sensor.
+        :rtype : dict
+        :param rows: An iterable of (room URI, sensor URI, binding) where binding holds ?type ?x ?y ?name
+        :return: Returns a dict of room URI to an ordered dict of sensor URI to a dict with keys types, name, x, y
+        """
+        rooms = {}
+        for room_name_uri, sensor_name_uri, binding in rows:
+            sensors = rooms.setdefault(room_name_uri, {})
+            sensor_data = sensors.get(sensor_name_uri)
+            if sensor_data is None:
+                sensor_data = {"types": [], "name": binding["name"]["value"],
+                               "x": binding["x"]["value"], "y": binding["y"]["value"]}
+                sensors[sensor_name_uri] = sensor_data
+            sensor_type = binding["type"]["value"]
+            if sensor_type != self.owl_named_individual and sensor_type not in sensor_data["types"]:
+                sensor_data["types"].append(sensor_type)
+        return rooms
+
+    def _add_room_placement_cart_coord(self, place: URIRef, points: list, place_name: str):
+        """
+        This method adds the coordinates of an individual given the points of its perimeter
         It outputs them in cartCoord syntax
         :type place_name: str
-        :type perimeter: str
-        :type place: Resource
-        :param place: A resource for which the coordinates are to be assigned
-        :param perimeter: A string of coordinates in the form x1:y1;x2:y2;...
+        :type points: list
+        :type place: URIRef
+        :param place: The individual for which the coordinates are to be assigned
+        :param points: The points of the perimeter as returned by KnoholemGeometry.parse_perimeter
         :param place_name: The name of the resource for which the coordinates are to be assigned
         :return: None
         """
-        point_list = self.out_graph.resource(self.out_ns + "coords_of_" + place_name)
-        point_list.set(RDF.type, URIRef(self.cart_ns.Point_List))
-        place.set(self.cart_ns.hasPlacement, point_list)
-        index = perimeter.find(';')
-        loop_count = 0
-        while index != -1:
-            point_string = perimeter[0:index]
-            perimeter = perimeter[index + 1:]
-            point = self.out_graph.resource(self.out_ns + place_name + "_point_" + str(loop_count))
-            point.set(RDF.type, URIRef(self.cart_ns.Point))
-            loop_count += 1
-            point_list.add(self.cart_ns.hasPoint, point)
-            colon = point_string.find(':')
-            if colon is not -1:
-                coord = Literal(point_string[0:colon], datatype="http://www.w3.org/2001/XMLSchema#double")
-                point.set(self.cart_ns.xcoord, coord)
-                point_string = point_string[colon + 1:]
-                colon = point_string.find(':')
-                if colon is not -1:
-                    coord = Literal(point_string[0:colon], datatype="http://www.w3.org/2001/XMLSchema#double")
-                else:
-                    coord = Literal(point_string, datatype="http://www.w3.org/2001/XMLSchema#double")
-                point.set(self.cart_ns.ycoord, coord)
-                point_string = point_string[colon + 1:]
-                colon = point_string.find(':')
-                if colon is not -1:
-                    coord = Literal(point_string[0:colon], datatype="http://www.w3.org/2001/XMLSchema#double")
-                    point.set(self.cart_ns.zcoord, coord)
-            index = perimeter.find(';')
-
-    def _add_room_placement_ifc_full(self, room, perimeter, room_name, contained_in_room):
-        """
-        This method add's the coordinates of an ifcSpace given a string of the perimiter coordinates
+        emit = self.emitter.emit
+        point_list = URIRef(self.out_ns + "coords_of_" + place_name)
+        emit((point_list, RDF.type, self.cart_point_list))
+        emit((place, self.cart_has_placement, point_list))
+        point_prefix = self.out_ns + place_name + "_point_"
+        for loop_count, (x, y, z) in enumerate(points):
+            point = URIRef(point_prefix + str(loop_count))
+            emit((point, RDF.type, self.cart_point))
+            emit((point_list, self.cart_has_point, point))
+            emit((point, self.cart_xcoord, Literal(x, datatype=self.xsd_double)))
+            emit((point, self.cart_ycoord, Literal(y, datatype=self.xsd_double)))
+            if z is not None:
+                emit((point, self.cart_zcoord, Literal(z, datatype=self.xsd_double)))
+
+    def _add_room_placement_ifc_full(self, room, points, room_name, contained_in_room):
+        """
+        This method add's the coordinates of an ifcSpace given the points of its perimeter
         It outputs them in the full Ifc syntax
         :type room_name: str
-        :type perimeter: str
-        :type room: Resource
-        :param room: A resource for the IfcSpace to be added
-        :param perimeter: The string of perimiter coordinates in the form x:y;x:y;...
+        :type points: list
+        :type room: URIRef
+        :param room: The IfcSpace to be added
+        :param points: The points of the perimeter as returned by KnoholemGeometry.parse_perimeter
         :param room_name: A string of the name of the IfcSpace
         """
+        emit = self.emitter.emit
+        if self.compact == "room":
+            self._shared_nodes.clear()
 
-        def add_corner(coord, counter):
-            point_list = self.out_graph.resource(
-                self.out_ns + room_name + "_boundary_" + str(index) + "_points_" + str(counter))
-            point_list.set(RDF.type, URIRef(self.ifc_ns.IfcCartesianPoint_List))
-            line.add(self.ifc_ns.Points, point_list)
-            point = self.out_graph.resource(
-                self.out_ns + room_name + "_boundary_" + str(index) + "_point_" + str(counter))
-            point.set(RDF.type, URIRef(self.ifc_ns.IfcCartesianPoint))
-            xcoord = create_coord_list(coord["x"],
-                                       room_name + "_boundary_" + str(index) + "_point_" + str(counter) + "_x")
-            point.set(self.ifc_ns.Coordinates, xcoord)
-            ycoord = create_coord_list(coord["y"],
-                                       room_name + "_boundary_" + str(index) + "_point_" + str(counter) + "_y")
-            xcoord.set(self.ifc_ns.hasNext, ycoord)
-            zcoord = create_coord_list(coord["z"],
-                                       room_name + "_boundary_" + str(index) + "_point_" + str(counter) + "_z")
-            ycoord.set(self.ifc_ns.hasNext, zcoord)
-            point_list.add(self.ifc_ns.hasListContent, point)
+        def add_corner(coord, corner_prefix):
+            point_list = URIRef(corner_prefix[0])
+            emit((point_list, RDF.type, self.ifc_cartesian_point_list))
+            emit((line, self.ifc_points, point_list))
+            if self.compact is not None:
+                emit((point_list, self.ifc_has_list_content, self._shared_point(coord, room_name)))
+                return point_list
+            point = URIRef(corner_prefix[1])
+            emit((point, RDF.type, self.ifc_cartesian_point))
+            xcoord = create_coord_list(coord[0], corner_prefix[1] + "_x")
+            emit((point, self.ifc_coordinates, xcoord))
+            ycoord = create_coord_list(coord[1], corner_prefix[1] + "_y")
+            emit((xcoord, self.ifc_has_next, ycoord))
+            zcoord = create_coord_list(coord[2], corner_prefix[1] + "_z")
+            emit((ycoord, self.ifc_has_next, zcoord))
+            emit((point_list, self.ifc_has_list_content, point))
             return point_list
 
-        def add_face(coord1, coord2):
-            coord3 = copy.deepcopy(coord2)
-            coord4 = copy.deepcopy(coord1)
-            coord3["z"] = self.HEIGHT_OF_WALLS
-            coord4["z"] = self.HEIGHT_OF_WALLS
-            point_list1 = add_corner(coord1, 0)
-            point_list2 = add_corner(coord2, 1)
-            point_list1.set(self.ifc_ns.hasNext, point_list2)
-            point_list3 = add_corner(coord3, 2)
-            point_list2.set(self.ifc_ns.hasNext, point_list3)
-            point_list4 = add_corner(coord4, 3)
-            point_list3.set(self.ifc_ns.hasNext, point_list4)
-            point_list4.set(self.ifc_ns.hasNext, point_list1)
-
-        def create_coord_list(coord_val, name_append):
-            coord_list = self.out_graph.resource(self.out_ns + name_append)
-            coord_list.set(RDF.type, URIRef(self.ifc_ns.IfcLengthMeasure_List))
-            coord = Literal(coord_val, datatype=URIRef(self.ifc_ns.IfcLengthMeasure))
-            coord_list.set(self.ifc_ns.hasListContent, coord)
+        def add_face(corners):
+            point_lists = [add_corner(corners[counter], corner_prefixes[counter]) for counter in range(4)]
+            for counter in range(4):
+                emit((point_lists[counter], self.ifc_has_next, point_lists[(counter + 1) % 4]))
+
+        def create_coord_list(coord_val, name):
+            coord_list = URIRef(name)
+            emit((coord_list, RDF.type, self.ifc_length_measure_list))
+            emit((coord_list, self.ifc_has_list_content, self._length_measure(coord_val)))
             return coord_list
 
-        def coord_string_to_array(coords_string):
-            """
-            :type coords_string: A string containing a list of the coords in the form x1:y1;x2:y2;...xN:yN;
-            :rtype : list
-            """
-            coords_out = []
-            semi_col_pos = coords_string.find(';')
-            while semi_col_pos != -1:
-                coordinate = coords_string[0:semi_col_pos]
-                coords_string = coords_string[semi_col_pos + 1:]
-                semi_col_pos = coords_string.find(';')
-                colon_pos = coordinate.find(':')
-                coords_out.append({
-                    "x": Decimal(coordinate[0:colon_pos]),
-                    "y": Decimal(coordinate[colon_pos + 1:]),
-                    "z": 0
-                })
-            return coords_out
-
-        overall_boundary = self.out_graph.resource(self.out_ns + room_name + "_boundary")
-        overall_boundary.set(RDF.type, URIRef(self.ifc_ns.IfcRelSpaceBoundary2ndLevel))
-        overall_boundary.set(self.ifc_ns.RelatingSpace, room)
-        coords = coord_string_to_array(perimeter)
-        coords.append(coords[0])
-        for index in range(len(coords) - 1):
-            wall = self.out_graph.resource(self.out_ns + room_name + "_wall_" + str(index))
-            wall.set(RDF.type, URIRef(self.ifc_ns.IfcWallStandardCase))
-            contained_in_room.add(self.ifc_ns.RelatedElements_of_IfcRelContainedInSpatialStructure, wall)
-            sub_boundary = self.out_graph.resource(self.out_ns + room_name + "_boundary_" + str(index))
-            sub_boundary.set(RDF.type, URIRef(self.ifc_ns.IfcRelSpaceBoundary2ndLevel))
-            sub_boundary.set(self.ifc_ns.RelatedBuildingElement, wall)
-            overall_boundary.add(self.ifc_ns.InnerBoundaries, sub_boundary)
-            sub_boundary.add(self.ifc_ns.ParentBoundary, overall_boundary)
-            csg = self.out_graph.resource(self.out_ns + room_name + "_boundary_" + str(index) + "_csg")
-            csg.set(RDF.type, URIRef(self.ifc_ns.IfcConnectionSurfaceGeometry))
-            sub_boundary.set(self.ifc_ns.ConnectionGeometry, csg)
-            cbp = self.out_graph.resource(self.out_ns + room_name + "_boundary_" + str(index) + "_cbp")
-            cbp.set(RDF.type, URIRef(self.ifc_ns.IfcCurveBoundedPlane))
-            csg.set(self.ifc_ns.SurfaceOnRelatingElement, cbp)
-            line = self.out_graph.resource(self.out_ns + room_name + "_boundary_" + str(index) + "_line")
-            line.set(RDF.type, URIRef(self.ifc_ns.IfcPolyline))
-            cbp.set(self.ifc_ns.OuterBoundary, line)
-            add_face(coords[index], coords[index + 1])
-            index += 1
+        overall_boundary = URIRef(self.out_ns + room_name + "_boundary")
+        emit((overall_boundary, RDF.type, self.ifc_space_boundary))
+        emit((overall_boundary, self.ifc_relating_space, room))
+        for index, corners in enumerate(wall_faces(points, self.HEIGHT_OF_WALLS)):
+            boundary_name = self.out_ns + room_name + "_boundary_" + str(index)
+            corner_prefixes = [(boundary_name + "_points_" + str(counter), boundary_name + "_point_" + str(counter))
+                               for counter in range(4)]
+            wall = URIRef(self.out_ns + room_name + "_wall_" + str(index))
+            emit((wall, RDF.type, self.ifc_wall))
+            emit((contained_in_room, self.ifc_related_elements, wall))
+            sub_boundary = URIRef(boundary_name)
+            emit((sub_boundary, RDF.type, self.ifc_space_boundary))
+            emit((sub_boundary, self.ifc_related_building_element, wall))
+            emit((overall_boundary, self.ifc_inner_boundaries, sub_boundary))
+            emit((sub_boundary, self.ifc_parent_boundary, overall_boundary))
+            csg = URIRef(boundary_name + "_csg")
+            emit((csg, RDF.type, self.ifc_connection_surface_geometry))
+            emit((sub_boundary, self.ifc_connection_geometry, csg))
+            cbp = URIRef(boundary_name + "_cbp")
+            emit((cbp, RDF.type, self.ifc_curve_bounded_plane))
+            emit((csg, self.ifc_surface_on_relating_element, cbp))
+            line = URIRef(boundary_name + "_line")
+            emit((line, RDF.type, self.ifc_polyline))
+            emit((cbp, self.ifc_outer_boundary, line))
+            add_face(corners)
+
+    def _shared_point(self, coord, room_name) -> URIRef:
+        """
+        Returns the IfcCartesianPoint of a corner in compact mode, adding it the first time it is seen.
+        Shared nodes are named after their coordinates, so a room converted in a worker process names them
+        as the serial run would
+        :rtype : URIRef
+        :param coord: The (x, y, z) of the corner
+        :param room_name: The name of the room the corner belongs to
+        :return: Returns the point
+        """
+        values = [str(value) for value in coord]
+        if self.compact == "room":
+            prefix = self.out_ns + room_name + "_"
+        else:
+            prefix = self.out_ns
+        point = URIRef(prefix + "vertex_" + "_".join(values))
+        if point not in self._shared_nodes:
+            self._shared_nodes.add(point)
+            emit = self.emitter.emit
+            emit((point, RDF.type, self.ifc_cartesian_point))
+            emit((point, self.ifc_coordinates, self._shared_coord_list(coord, values, prefix)))
+        return point
+
+    def _shared_coord_list(self, coord, values, prefix) -> URIRef:
+        """
+        Returns the IfcLengthMeasure_List holding coord in compact mode, adding it the first time it is seen.
+        Lists are shared by their tails too: the y, z list of a point is shared with every point with the same y and z
+        :rtype : URIRef
+        :param coord: The coordinates in the list
+        :param values: The coordinates as strings
+        :param prefix: The start of the names of the shared nodes
+        :return: Returns the list
+        """
+        coord_list = URIRef(prefix + "coords_" + "_".join(values))
+        if coord_list not in self._shared_nodes:
+            self._shared_nodes.add(coord_list)
+            emit = self.emitter.emit
+            emit((coord_list, RDF.type, self.ifc_length_measure_list))
+            emit((coord_list, self.ifc_has_list_content, self._length_measure(coord[0])))
+            if len(coord) > 1:
+                emit((coord_list, self.ifc_has_next, self._shared_coord_list(coord[1:], values[1:], prefix)))
+        return coord_list
+
+    def _length_measure(self, coord_val) -> Literal:
+        """
+        Returns the IfcLengthMeasure literal of a coordinate, reusing the literal of a coordinate seen before in the
+        same room, or anywhere in the building when the whole output is kept in memory
+        :rtype : Literal
+        :param coord_val: The Decimal or int coordinate
+        :return: Returns the literal of the coordinate
+        """
+        key = str(coord_val)
+        literal = self._length_measures.get(key)
+        if literal is None:
+            literal = Literal(coord_val, datatype=self.ifc_length_measure)
+            self._length_measures[key] = literal
+        return literal
 
     # def _add_placement_ifc_full(self, room: Resource, perimeter: str, room_name: str):
     #     """
@@ -352,32 +915,38 @@ class KnoholemIfc:
         """
         Converts the sensors of a Knoholem Dataset to IfcOWL
         :type qualified_room_name: str
-        :type contained_in_room: Resource
-        :param contained_in_room: A resource of type ifcRelContainedInStructure
+        :type contained_in_room: URIRef
+        :param contained_in_room: The individual of type ifcRelContainedInStructure
         :param qualified_room_name: The name of the relating structure to contained_in_room
         :return: None
         """
-        query = """%s
+        for each in self.iter_sparql_query(self._sensor_list_query(qualified_room_name)):
+            sensor_name_uri = each["y"]["value"]
+            sensors = self._group_sensor_bindings(
+                (qualified_room_name, sensor_name_uri, binding)
+                for binding in self.iter_sparql_query(self._sensor_query(sensor_name_uri)))
+            self._add_sensor(contained_in_room, sensor_name_uri, sensors[qualified_room_name][sensor_name_uri])
+
+    def _sensor_list_query(self, qualified_room_name) -> str:
+        """
+        :rtype : str
+        :param qualified_room_name: The full URI of a room
+        :return: Returns the query of the sensors of the room
+        """
+        return """%s
             SELECT ?y
             FROM <%s>
             WHERE {
                 ?y knoholem:isSensorOf %s
             }""" % (self.sparql_prefix, self.sparql_graph, "<" + qualified_room_name + ">")
-        sensor_results = self.run_sparql_query(query)
 
-        def get_type_for_sensor(result_set):
-            index = 0
-            result = result_set["results"]["bindings"][index]["type"]["value"]
-            while result.find("http://www.w3.org/2002/07/owl#NamedIndividual") is not -1:
-                index += 1
-                result = result_set["results"]["bindings"][index]["type"]["value"]
-            return self.strip_uri(result)
-
-        for each in sensor_results["results"]["bindings"]:
-            sensor_name_uri = each["y"]["value"]
-            # self.visualize.put_sensor(sensor_name_uri)
-            sensor_name = self.strip_uri(sensor_name_uri)
-            query = u"""{0:s}
+    def _sensor_query(self, sensor_name_uri) -> str:
+        """
+        :rtype : str
+        :param sensor_name_uri: The full URI of a sensor
+        :return: Returns the query of the types, name and placement of the sensor
+        """
+        return u"""{0:s}
                 SELECT ?type ?x ?y ?name
                 FROM <{1:s}>
                 WHERE {{
@@ -387,36 +956,73 @@ class KnoholemIfc:
                     ?pos knoholem:hasXCoord ?x .
                     ?pos knoholem:hasYCoord ?y
                 }}""".format(self.sparql_prefix, self.sparql_graph, sensor_name_uri)
-            this_sensor_result = self.run_sparql_query(query)
-            this_sensor_type_kno = get_type_for_sensor(this_sensor_result)
-            if this_sensor_type_kno in self.knoToIfcSensor:
-                sensor_type_ifc = self.knoToIfcSensor[this_sensor_type_kno]
-            else:
-                sensor_type_ifc = "UNDEFINED"
-            if this_sensor_type_kno in self.knoToIfcEntity:
-                sensor_entity_ifc = self.knoToIfcEntity[this_sensor_type_kno]
-            else:
-                sensor_entity_ifc = "IfcSensor"
-            sensor = self.out_graph.resource(self.out_ns + sensor_name)
-            sensor.set(RDF.type, URIRef(self.ifc_ns + sensor_entity_ifc))
-            sensor_label = Literal(this_sensor_result["results"]["bindings"][0]["name"]["value"])
-            sensor.set(self.rdfs.label, sensor_label)
-            if sensor_entity_ifc is "IfcSensor":
-                sensor.set(self.ifc_ns.PredefinedType_of_IfcSensor, URIRef(self.ifc_ns + sensor_type_ifc))
-            else:
-                sensor.set(self.ifc_ns.PredefinedType_of_IfcFlowMeter, URIRef(self.ifc_ns + sensor_type_ifc))
-            contained_in_room.add(self.ifc_ns.RelatedElements_of_IfcRelContainedInSpatialStructure, sensor)
-            sensor_point = self.out_graph.resource(self.out_ns + sensor_name + "_point")
-            sensor_point.set(RDF.type, self.cart_ns.Point)
-            xcoord = Literal(this_sensor_result["results"]["bindings"][0]["x"]["value"],
-                             datatype="http://www.w3.org/2001/XMLSchema#double")
-            ycoord = Literal(this_sensor_result["results"]["bindings"][0]["y"]["value"],
-                             datatype="http://www.w3.org/2001/XMLSchema#double")
-            sensor_point.set(self.cart_ns.xcoord, xcoord)
-            sensor_point.set(self.cart_ns.ycoord, ycoord)
-            sensor.set(self.cart_ns.hasPlacement, sensor_point)
+
+    def _add_sensor(self, contained_in_room, sensor_name_uri, sensor_data):
+        """
+        Adds a single sensor to the output graph and places it in a room
+        :type contained_in_room: URIRef
+        :type sensor_name_uri: str
+        :type sensor_data: dict
+        :param contained_in_room: The individual of type ifcRelContainedInStructure
+        :param sensor_name_uri: The full URI of the sensor in the input graph
+        :param sensor_data: The types, name and coordinates of the sensor, see _group_sensor_bindings
+        :return: None
+        """
+        # self.visualize.put_sensor(sensor_name_uri)
+        sensor_name = self.strip_uri(sensor_name_uri)
+        this_sensor_type_kno = self.strip_uri(sensor_data["types"][0])
+        if this_sensor_type_kno in self.knoToIfcSensor:
+            sensor_type_ifc = self.knoToIfcSensor[this_sensor_type_kno]
+        else:
+            sensor_type_ifc = "UNDEFINED"
+        if this_sensor_type_kno in self.knoToIfcEntity:
+            sensor_entity_ifc = self.knoToIfcEntity[this_sensor_type_kno]
+        else:
+            sensor_entity_ifc = "IfcSensor"
+        self.metrics.count("sensors")
+        emit = self.emitter.emit
+        sensor = URIRef(self.out_ns + sensor_name)
+        emit((sensor, RDF.type, self.ifc_ns[sensor_entity_ifc]))
+        emit((sensor, self.rdfs_label, Literal(sensor_data["name"])))
+        if sensor_entity_ifc == "IfcSensor":
+            emit((sensor, self.ifc_sensor_predefined_type, self.ifc_ns[sensor_type_ifc]))
+        else:
+            emit((sensor, self.ifc_flow_meter_predefined_type, self.ifc_ns[sensor_type_ifc]))
+        emit((contained_in_room, self.ifc_related_elements, sensor))
+        sensor_point = URIRef(self.out_ns + sensor_name + "_point")
+        emit((sensor_point, RDF.type, self.cart_point))
+        emit((sensor_point, self.cart_xcoord, Literal(sensor_data["x"], datatype=self.xsd_double)))
+        emit((sensor_point, self.cart_ycoord, Literal(sensor_data["y"], datatype=self.xsd_double)))
+        emit((sensor, self.cart_has_placement, sensor_point))
+
+
+def _emit_rooms(args) -> tuple:
+    """
+    Converts a chunk of rooms in a worker process
+    :rtype : tuple
+    :param args: A tuple of the original uri, the uri to use, the compact option, the validate option,
+        whether to return N-Triples and a list of (room query row, sensors of the room)
+    :return: Returns a list holding the list of triples, or the N-Triples, of each room in the order the rooms
+        were given, and the invalid terms found in them as recorded by Instrumentation
+    """
+    original_uri, uri_to_use, compact, validate, as_ntriples, rooms = args
+    converter = KnoholemIfc._room_converter(original_uri, uri_to_use, compact, validate)
+    room_outputs = []
+    for result, sensors in rooms:
+        converter._emit_room(result, sensors)
+        if as_ntriples:
+            room_outputs.append(converter.out_graph.serialize(format="nt", encoding="utf-8"))
+        else:
+            room_outputs.append(list(converter.out_graph))
+        converter.out_graph.remove((None, None, None))
+        converter._length_measures.clear()
+    return room_outputs, converter.metrics.invalid_terms
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     # rdf_stf("http://localhost:3030/ifcowl/", "http://localhost:3030/ifcowl/data/knoholem.owl")
-    KnoholemIfc(sys.argv[1], sys.argv[2])
+    if os.path.isfile(sys.argv[1]):
+        KnoholemIfc(None, sys.argv[2], source=LocalGraphSource(sys.argv[1], sys.argv[2]))
+    else:
+        KnoholemIfc(sys.argv[1], sys.argv[2])
@@ -0,0 +1,150 @@
+import cProfile
+import json
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+__author__ = 'Diarmuid Ryan'
+
+
+class Instrumentation:
+    """
+    Collects timers and counters for the stages of a conversion, its queries and its rooms,
+    optionally profiling the run with cProfile and tracemalloc, and exports them as JSON
+    """
+
+    profile_entries = 30  # functions listed in the profile, by cumulative time
+    memory_entries = 10  # allocation sites listed by tracemalloc
+
+    def __init__(self, profile=False, trace_memory=False):
+        """
+        :param profile: If True, profile the run with cProfile
+        :param trace_memory: If True, trace memory allocations with tracemalloc
+        """
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self.counters = {}
+        self.queries = []
+        self.room_triples = {}
+        self.invalid_terms = {}
+        self._profiler = None
+        self._profile_entries = None
+        self._memory = None
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Times the enclosed block, adding to the total of any earlier block of the same name
+        :param name: The name of the stage
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stage = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+            stage["seconds"] += time.perf_counter() - start
+            stage["calls"] += 1
+
+    def count(self, name, amount=1):
+        """
+        Adds to a counter
+        :param name: The name of the counter
+        :param amount: The amount to be added
+        :return: None
+        """
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_query(self, query, seconds, rows, size=None):
+        """
+        Records a sparql query
+        :param query: The text of the query
+        :param seconds: How long the query took
+        :param rows: The number of result rows
+        :param size: The size in bytes of the response, None if it is not known
+        :return: None
+        """
+        self.queries.append({"query": " ".join(query.split())[-300:], "seconds": seconds, "rows": rows,
+                             "bytes": size})
+
+    def record_room(self, room_name, triples):
+        """
+        Records the number of triples emitted for a room
+        :param room_name: The name of the room
+        :param triples: The number of triples
+        :return: None
+        """
+        self.room_triples[room_name] = self.room_triples.get(room_name, 0) + triples
+        self.count("rooms")
+        self.count("triples", triples)
+
+    def record_invalid_term(self, term, reason, count=1):
+        """
+        Records a term of the output which the ontology does not allow
+        :param term: The URI of the term
+        :param reason: Why the term is not allowed
+        :param count: The number of times it was emitted
+        :return: None
+        """
+        entry = self.invalid_terms.setdefault(str(term), {"reason": reason, "count": 0})
+        entry["count"] += count
+
+    def start(self):
+        """
+        Starts the profiler and memory tracing, if they are enabled
+        :return: None
+        """
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.profile:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def stop(self):
+        """
+        Stops the profiler and memory tracing, keeping their results
+        :return: None
+        """
+        if self._profiler is not None:
+            self._profiler.disable()
+            stats = pstats.Stats(self._profiler)
+            entries = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+            self._profile_entries = [
+                {"function": "{0:s}:{1:d}({2:s})".format(*function), "calls": calls, "own_seconds": own_seconds,
+                 "cumulative_seconds": cumulative_seconds}
+                for function, (primitive_calls, calls, own_seconds, cumulative_seconds, callers)
+                in entries[:self.profile_entries]]
+            self._profiler = None
+        if self.trace_memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            self._memory = {"current_bytes": current, "peak_bytes": peak, "top": [
+                {"location": str(statistic.traceback), "bytes": statistic.size, "blocks": statistic.count}
+                for statistic in snapshot.statistics("lineno")[:self.memory_entries]]}
+            tracemalloc.stop()
+
+    def to_dict(self) -> dict:
+        """
+        :rtype : dict
+        :return: Returns everything recorded, in the form written by write_json
+        """
+        query_totals = {"count": len(self.queries), "seconds": sum(query["seconds"] for query in self.queries),
+                        "rows": sum(query["rows"] for query in self.queries),
+                        "bytes": sum(query["bytes"] or 0 for query in self.queries)}
+        out = {"stages": self.stages, "counters": self.counters, "query_totals": query_totals,
+               "queries": self.queries, "room_triples": self.room_triples, "invalid_terms": self.invalid_terms}
+        if self._profile_entries is not None:
+            out["profile"] = self._profile_entries
+        if self._memory is not None:
+            out["memory"] = self._memory
+        return out
+
+    def write_json(self, filename):
+        """
+        Writes everything recorded to a JSON file
+        :param filename: The path of the file to be written
+        :return: None
+        """
+        with open(filename, "w", encoding="utf-8") as out_file:
+            json.dump(self.to_dict(), out_file, indent=2, sort_keys=True)
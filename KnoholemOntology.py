@@ -0,0 +1,211 @@
+import hashlib
+import json
+import logging
+import os
+
+from rdflib import Graph, RDF, RDFS, OWL, BNode, URIRef, Literal
+from rdflib.collection import Collection
+
+__author__ = 'Diarmuid Ryan'
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ONTOLOGY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "IFC4_ADD1.owl")
+
+
+class OntologyIndex:
+    """
+    A compact index of the terms of an OWL ontology: its classes, its properties with their domains and ranges,
+    and its named individuals, such as the values of the IFC enumerations, with their types.
+    Parsing the ontology takes seconds, so the index is built once and kept in a JSON file beside it,
+    which is rebuilt only when the ontology changes
+    """
+
+    index_format = 1  # bump when the layout of the index file changes
+    _loaded = {}  # indexes already loaded by this process, by ontology, index file and stamp
+
+    def __init__(self, namespace, classes, properties, domains, ranges, individuals):
+        """
+        :param namespace: The namespace of the ontology's own terms
+        :param classes: An iterable of the URIRefs of the classes
+        :param properties: An iterable of the URIs of the object and datatype properties
+        :param domains: A dict of property URI to a list of the URIs of its domain classes
+        :param ranges: A dict of property URI to a list of the URIs of its range classes
+        :param individuals: A dict of named individual URI to a list of the URIs of its types
+        """
+        self.namespace = namespace
+        self.classes = frozenset(classes)
+        self.properties = frozenset(properties)
+        self.domains = {prop: frozenset(classes) for prop, classes in domains.items()}
+        self.ranges = {prop: frozenset(classes) for prop, classes in ranges.items()}
+        self.individuals = {individual: frozenset(types) for individual, types in individuals.items()}
+
+    @classmethod
+    def load(cls, owl_filename=DEFAULT_ONTOLOGY, index_filename=None):
+        """
+        Loads the index of an ontology, building it if it has not been built since the ontology last changed.
+        An index is only read from disk once per process
+        :rtype : OntologyIndex
+        :param owl_filename: The path of the ontology, in RDF/XML
+        :param index_filename: The path of the index file. Defaults to the ontology's path with .index.json
+            in place of its extension
+        :return: Returns the index
+        """
+        if index_filename is None:
+            index_filename = os.path.splitext(owl_filename)[0] + ".index.json"
+        stat = os.stat(owl_filename)
+        stamp = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        key = (owl_filename, index_filename, stat.st_size, stat.st_mtime_ns)
+        if key not in cls._loaded:
+            cls._loaded[key] = cls._from_dict(cls._read(owl_filename, index_filename, stamp))
+        return cls._loaded[key]
+
+    @classmethod
+    def _read(cls, owl_filename, index_filename, stamp) -> dict:
+        """
+        Reads the index file, rebuilding it first if the ontology has changed
+        :rtype : dict
+        :param owl_filename: The path of the ontology
+        :param index_filename: The path of the index file
+        :param stamp: The size and modification time of the ontology
+        :return: Returns the index in the form it is stored in
+        """
+        index = None
+        try:
+            with open(index_filename, "r", encoding="utf-8") as index_file:
+                index = json.load(index_file)
+        except (IOError, ValueError):
+            pass
+        if index is not None and index.get("format") == cls.index_format:
+            if index["source"]["size"] == stamp["size"] and index["source"]["mtime_ns"] == stamp["mtime_ns"]:
+                return index
+            # A touched but unchanged ontology, e.g. after a checkout, only needs a new stamp
+            stamp["sha256"] = cls._hash(owl_filename)
+            if index["source"].get("sha256") == stamp["sha256"]:
+                index["source"] = stamp
+                cls._write(index_filename, index)
+                return index
+        logger.info("Building the index of " + owl_filename)
+        if "sha256" not in stamp:
+            stamp["sha256"] = cls._hash(owl_filename)
+        index = cls.build(owl_filename)
+        index["source"] = stamp
+        cls._write(index_filename, index)
+        return index
+
+    @classmethod
+    def build(cls, owl_filename) -> dict:
+        """
+        Parses an ontology and indexes its terms
+        :rtype : dict
+        :param owl_filename: The path of the ontology, in RDF/XML
+        :return: Returns the index in the form it is stored in, with the ontology's own terms as local names
+        """
+        graph = Graph()
+        graph.parse(owl_filename, format="xml")
+        namespace = None
+        for ontology in graph.subjects(RDF.type, OWL.Ontology):
+            namespace = str(ontology).rstrip("#/") + "#"
+
+        def local(uri):
+            uri = str(uri)
+            return uri[len(namespace):] if uri.startswith(namespace) else uri
+
+        def named_classes(class_expression):
+            # Domains and ranges are either a class or the union of a list of classes
+            if isinstance(class_expression, URIRef):
+                return [local(class_expression)]
+            members = []
+            union = graph.value(class_expression, OWL.unionOf)
+            if isinstance(class_expression, BNode) and union is not None:
+                for member in Collection(graph, union):
+                    members.extend(named_classes(member))
+            return members
+
+        classes = sorted(local(term) for term in graph.subjects(RDF.type, OWL.Class) if isinstance(term, URIRef))
+        properties = sorted(set(local(term) for property_type in (OWL.ObjectProperty, OWL.DatatypeProperty)
+                                for term in graph.subjects(RDF.type, property_type) if isinstance(term, URIRef)))
+        domains = {}
+        ranges = {}
+        for prop in properties:
+            prop_uri = URIRef(namespace + prop) if ":" not in prop else URIRef(prop)
+            for domain in graph.objects(prop_uri, RDFS.domain):
+                domains.setdefault(prop, []).extend(named_classes(domain))
+            for prop_range in graph.objects(prop_uri, RDFS.range):
+                ranges.setdefault(prop, []).extend(named_classes(prop_range))
+        individuals = {}
+        for individual in graph.subjects(RDF.type, OWL.NamedIndividual):
+            if isinstance(individual, URIRef):
+                individuals[local(individual)] = sorted(local(individual_type) for individual_type in
+                                                        graph.objects(individual, RDF.type)
+                                                        if individual_type != OWL.NamedIndividual)
+        return {"format": cls.index_format, "namespace": namespace, "classes": classes, "properties": properties,
+                "domains": domains, "ranges": ranges, "individuals": individuals}
+
+    def unknown_terms(self, triples) -> list:
+        """
+        Checks the terms of triples against the ontology. Only terms in the ontology's namespace are checked,
+        each in constant time
+        :rtype : list
+        :param triples: An iterable of (subject, predicate, object) tuples of rdflib terms
+        :return: Returns a list of (term, reason) tuples, one for each problem found
+        """
+        namespace = self.namespace
+        problems = []
+        for s, p, o in triples:
+            if p == RDF.type:
+                if o.startswith(namespace) and o not in self.classes:
+                    problems.append((o, "not a class of the ontology"))
+                continue
+            if p.startswith(namespace) and p not in self.properties:
+                problems.append((p, "not a property of the ontology"))
+            if isinstance(o, Literal):
+                if o.datatype is not None and o.datatype.startswith(namespace) and o.datatype not in self.classes:
+                    problems.append((o.datatype, "not a class of the ontology"))
+            elif o.startswith(namespace):
+                types = self.individuals.get(o)
+                if types is None:
+                    if o not in self.classes:
+                        problems.append((o, "not an individual of the ontology"))
+                elif p in self.ranges and not types & self.ranges[p]:
+                    problems.append((o, "not in the range of " + p))
+        return problems
+
+    @classmethod
+    def _from_dict(cls, index):
+        namespace = index["namespace"]
+
+        def expand(name):
+            # rdflib terms are never equal to plain strings, so the index holds terms
+            return URIRef(name if ":" in name else namespace + name)
+
+        return cls(namespace, [expand(name) for name in index["classes"]],
+                   [expand(name) for name in index["properties"]],
+                   {expand(prop): [expand(name) for name in names] for prop, names in index["domains"].items()},
+                   {expand(prop): [expand(name) for name in names] for prop, names in index["ranges"].items()},
+                   {expand(individual): [expand(name) for name in names]
+                    for individual, names in index["individuals"].items()})
+
+    @staticmethod
+    def _hash(filename) -> str:
+        digest = hashlib.sha256()
+        with open(filename, "rb") as owl_file:
+            for block in iter(lambda: owl_file.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _write(index_filename, index):
+        """
+        Writes the index file, leaving the ontology unindexed on disk if its directory can not be written to
+        :param index_filename: The path of the index file
+        :param index: The index, as returned by build
+        :return: None
+        """
+        temp_filename = index_filename + ".tmp"
+        try:
+            with open(temp_filename, "w", encoding="utf-8") as index_file:
+                json.dump(index, index_file, separators=(",", ":"), sort_keys=True)
+            os.replace(temp_filename, index_filename)
+        except IOError as error:
+            logger.warning("Could not write the ontology index {0:s}: {1:s}".format(index_filename, str(error)))
@@ -0,0 +1,82 @@
+import gzip
+import io
+
+__author__ = 'Diarmuid Ryan'
+
+
+class NTriplesStreamWriter:
+    """
+    Writes graphs to an N-Triples file as they are produced, so the whole output never has to be held in memory
+    """
+
+    def __init__(self, filename, compress=False, buffer_size=1024 * 1024):
+        """
+        :param filename: The path of the N-Triples file to be written
+        :param compress: If True, gzip the output
+        :param buffer_size: The number of bytes held in memory before they are written to the file
+        """
+        self.filename = filename
+        if compress:
+            self._file = gzip.open(filename, "wb")
+        else:
+            self._file = open(filename, "wb")
+        self._buffer = io.BufferedWriter(self._file, buffer_size=buffer_size)
+        self.triple_count = 0
+
+    def write_graph(self, graph):
+        """
+        Appends every triple of a graph to the output
+        :type graph: Graph
+        :param graph: The graph to be written
+        :return: None
+        """
+        self.write_ntriples(graph.serialize(format="nt", encoding="utf-8"))
+
+    def write_ntriples(self, data):
+        """
+        Appends already serialized triples to the output
+        :type data: bytes
+        :param data: UTF-8 encoded N-Triples
+        :return: None
+        """
+        self.triple_count += data.count(b"\n")
+        self._buffer.write(data)
+
+    def close(self):
+        """
+        Flushes the buffer and closes the output file
+        :return: None
+        """
+        self._buffer.close()
+
+    def abort(self):
+        """
+        Closes the output file after a failed conversion, keeping the rooms written so far
+        :return: None
+        """
+        self._buffer.close()
+
+
+class TripleEmitter:
+    """
+    Collects triples as plain tuples and adds them to a graph in one batch with addN,
+    instead of paying for the remove-then-add of rdflib's Resource.set on every triple
+    """
+
+    def __init__(self, graph):
+        """
+        :type graph: Graph
+        :param graph: The graph the triples are added to
+        """
+        self.graph = graph
+        self.triples = []
+        self.emit = self.triples.append
+
+    def flush(self):
+        """
+        Adds the collected triples to the graph
+        :return: None
+        """
+        graph = self.graph
+        graph.addN((s, p, o, graph) for s, p, o in self.triples)
+        del self.triples[:]
@@ -0,0 +1,265 @@
+import gzip
+import queue
+import threading
+import time
+import zlib
+from http.client import HTTPConnection, HTTPSConnection, HTTPException
+from urllib.parse import urlsplit, quote
+
+__author__ = 'Diarmuid Ryan'
+
+
+class GraphStorePublisher:
+    """
+    Writes graphs to a named graph of a triple store using the SPARQL 1.1 Graph Store HTTP Protocol.
+    A single keep-alive connection is reused for every request.
+    Graphs uploaded in the background are collected in a staging graph, which only replaces the graph at close,
+    so a failed conversion never leaves the graph empty or half written.
+    """
+
+    n3_content_type = "text/n3; charset=utf-8"
+    ntriples_content_type = "application/n-triples"
+    update_content_type = "application/sparql-update; charset=utf-8"
+    chunk_size = 64 * 1024
+
+    def __init__(self, sparql_endpoint_url, graph_name, compress=False, batch_size=4 * 1024 * 1024,
+                 retries=3, backoff=1.0, timeout=60):
+        """
+        :param sparql_endpoint_url: The URL of the graph store service, e.g. http://localhost:3030/dataset/
+        :param graph_name: The name of the graph to be written
+        :param compress: If True, gzip request bodies
+        :param batch_size: The number of N-Triples bytes collected by write_graph before they are POSTed
+        :param retries: The number of times a failed request is retried
+        :param backoff: The delay in seconds before the first retry, doubled for every further retry
+        :param timeout: The socket timeout in seconds
+        """
+        url = urlsplit(sparql_endpoint_url)
+        self.scheme = url.scheme
+        self.netloc = url.netloc
+        self.graph_name = graph_name
+        self.update_target = url.path or "/"
+        self.target = "{0:s}?graph={1:s}".format(url.path or "/", quote(graph_name, safe=""))
+        self.staging_graph_name = graph_name + "_staging"
+        self.staging_target = "{0:s}?graph={1:s}".format(url.path or "/", quote(self.staging_graph_name, safe=""))
+        self.compress = compress
+        self.batch_size = batch_size
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._connection = None
+        self._pending = []
+        self._pending_size = 0
+        self._queue = None
+        self._worker = None
+        self._worker_error = None
+        self._aborted = False
+        self._staged = False
+
+    def delete(self):
+        """
+        Deletes the graph, a graph which does not exist is not an error
+        :return: None
+        """
+        self._request("DELETE", None, None, allowed_statuses=(404,))
+
+    def put(self, data, content_type):
+        """
+        Replaces the graph with the given data
+        :type data: bytes
+        :param data: The serialized graph
+        :param content_type: The media type of data
+        :return: None
+        """
+        self._request("PUT", lambda: self._encode(data), content_type)
+
+    def post(self, data, content_type):
+        """
+        Adds the given data to the graph
+        :type data: bytes
+        :param data: The serialized triples
+        :param content_type: The media type of data
+        :return: None
+        """
+        self._request("POST", lambda: self._encode(data), content_type)
+
+    def update(self, sparql_update):
+        """
+        Runs a SPARQL 1.1 update against the service
+        :type sparql_update: str
+        :param sparql_update: The update request
+        :return: None
+        """
+        self._request("POST", lambda: self._encode(sparql_update.encode("utf-8")), self.update_content_type,
+                      target=self.update_target)
+
+    def put_file(self, filename, content_type):
+        """
+        Replaces the graph with the contents of a file. The file is streamed with chunked transfer encoding.
+        :param filename: The path of the file to be uploaded
+        :param content_type: The media type of the file
+        :return: None
+        """
+        self._request("PUT", lambda: self._read_chunks(filename), content_type)
+
+    def start(self):
+        """
+        Starts uploading the graphs passed to write_graph to the staging graph in the background.
+        The graph itself is left as it is until close
+        :return: None
+        """
+        self._request("DELETE", None, None, allowed_statuses=(404,), target=self.staging_target)
+        self._queue = queue.Queue(maxsize=4)
+        self._worker = threading.Thread(target=self._upload_batches, daemon=True)
+        self._worker.start()
+
+    def write_graph(self, graph):
+        """
+        Queues every triple of a graph to be POSTed to the triple store once a batch has been collected
+        :type graph: Graph
+        :param graph: The graph to be uploaded
+        :return: None
+        """
+        self.write_ntriples(graph.serialize(format="nt", encoding="utf-8"))
+
+    def write_ntriples(self, data):
+        """
+        Queues already serialized triples to be POSTed to the triple store once a batch has been collected
+        :type data: bytes
+        :param data: UTF-8 encoded N-Triples
+        :return: None
+        """
+        self._pending.append(data)
+        self._pending_size += len(data)
+        if self._pending_size >= self.batch_size:
+            self._queue_pending()
+
+    def close(self):
+        """
+        Uploads any remaining triples, waits for the background uploads to finish, replaces the graph with the
+        staging graph and closes the connection
+        :return: None
+        """
+        try:
+            if self._worker is not None:
+                self._queue_pending()
+                self._stop_worker()
+                if self._worker_error is not None:
+                    raise self._worker_error
+                if self._staged:
+                    self.update("MOVE GRAPH <{0:s}> TO GRAPH <{1:s}>".format(self.staging_graph_name,
+                                                                           self.graph_name))
+                else:
+                    self.delete()
+        finally:
+            self._close_connection()
+
+    def abort(self):
+        """
+        Stops the background uploads and drops the staging graph, leaving the graph as it was before start,
+        then closes the connection
+        :return: None
+        """
+        try:
+            if self._worker is not None:
+                self._aborted = True
+                self._pending = []
+                self._pending_size = 0
+                self._stop_worker()
+                self._request("DELETE", None, None, allowed_statuses=(404,), target=self.staging_target)
+        except (IOError, HTTPException):
+            pass
+        finally:
+            self._close_connection()
+
+    def _stop_worker(self):
+        self._queue.put(None)
+        self._worker.join()
+        self._worker = None
+
+    def _close_connection(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _queue_pending(self):
+        if self._worker_error is not None:
+            raise self._worker_error
+        if self._pending:
+            self._queue.put(b"".join(self._pending))
+            self._pending = []
+            self._pending_size = 0
+
+    def _upload_batches(self):
+        while True:
+            data = self._queue.get()
+            if data is None:
+                return
+            if self._worker_error is None and not self._aborted:
+                try:
+                    self._request("POST", lambda: self._encode(data), self.ntriples_content_type,
+                                  target=self.staging_target)
+                    self._staged = True
+                except (IOError, HTTPException) as error:
+                    self._worker_error = error
+
+    def _encode(self, data):
+        if self.compress:
+            return gzip.compress(data)
+        return data
+
+    def _read_chunks(self, filename):
+        compressor = zlib.compressobj(wbits=31) if self.compress else None
+        with open(filename, "rb") as in_file:
+            chunk = in_file.read(self.chunk_size)
+            while chunk:
+                if compressor is not None:
+                    chunk = compressor.compress(chunk)
+                if chunk:
+                    yield chunk
+                chunk = in_file.read(self.chunk_size)
+        if compressor is not None:
+            yield compressor.flush()
+
+    def _request(self, method, body_factory, content_type, allowed_statuses=(), target=None):
+        """
+        Sends one request over the shared connection, reconnecting and retrying on failure
+        :param method: The HTTP method
+        :param body_factory: A function returning a fresh request body for each attempt, or None for no body
+        :param content_type: The media type of the body
+        :param allowed_statuses: Error statuses which are not to be treated as a failure
+        :param target: The path and query of the request. Leave empty to address the graph
+        :return: None
+        """
+        if target is None:
+            target = self.target
+        attempt = 0
+        while True:
+            headers = {}
+            body = None
+            if body_factory is not None:
+                body = body_factory()
+                headers["Content-Type"] = content_type
+                if self.compress:
+                    headers["Content-Encoding"] = "gzip"
+            try:
+                if self._connection is None:
+                    connection_class = HTTPSConnection if self.scheme == "https" else HTTPConnection
+                    self._connection = connection_class(self.netloc, timeout=self.timeout)
+                self._connection.request(method, target, body=body, headers=headers)
+                response = self._connection.getresponse()
+                response.read()
+                if response.status < 400 or response.status in allowed_statuses:
+                    return
+                error = IOError("{0:s} {1:s} failed: HTTP {2:d} {3:s}".format(
+                    method, target, response.status, response.reason))
+                retry = response.status >= 500
+            except (IOError, HTTPException) as connection_error:
+                if self._connection is not None:
+                    self._connection.close()
+                    self._connection = None
+                error = connection_error
+                retry = True
+            if not retry or attempt >= self.retries:
+                raise error
+            time.sleep(self.backoff * (2 ** attempt))
+            attempt += 1
@@ -0,0 +1,255 @@
+import json
+import re
+import threading
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+from rdflib import Dataset, URIRef, Literal, BNode
+from rdflib.util import guess_format
+from SPARQLWrapper import SPARQLWrapper, JSON, TSV
+
+__author__ = 'Diarmuid Ryan'
+
+XSD = "http://www.w3.org/2001/XMLSchema#"
+
+_tsv_literal = re.compile(r'"(.*)"(?:@([A-Za-z0-9-]+)|\^\^<(.*)>)?$', re.DOTALL)
+_tsv_escape = re.compile(r'\\(u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|.)', re.DOTALL)
+_tsv_escapes = {"t": "\t", "n": "\n", "r": "\r", "b": "\b", "f": "\f"}
+
+
+class SparqlEndpointSource:
+    """
+    Answers the converter's queries by sending them to a sparql endpoint over HTTP.
+    Each thread queries through its own SPARQLWrapper, so queries can be run from several threads at once
+    """
+
+    def __init__(self, sparql_endpoint_url):
+        """
+        :param sparql_endpoint_url: The URL of the sparql endpoint to be queried
+        """
+        self.sparql_endpoint = sparql_endpoint_url
+        self._local = threading.local()
+
+    @property
+    def sparql(self) -> SPARQLWrapper:
+        """
+        :rtype : SPARQLWrapper
+        :return: Returns the SPARQLWrapper of the current thread
+        """
+        sparql = getattr(self._local, "sparql", None)
+        if sparql is None:
+            sparql = self._local.sparql = SPARQLWrapper(self.sparql_endpoint)
+        return sparql
+
+    @property
+    def last_response_bytes(self):
+        """
+        :return: Returns the size in bytes of the last response received by the current thread
+        """
+        return getattr(self._local, "last_response_bytes", None)
+
+    @last_response_bytes.setter
+    def last_response_bytes(self, size):
+        self._local.last_response_bytes = size
+
+    def query(self, query) -> dict:
+        """
+        Runs a sparql query against the endpoint
+        :rtype : dict
+        :param query: The query to be run
+        :return: Returns a dict in the SPARQL 1.1 JSON results format
+        """
+        self.sparql.setQuery(query)
+        self.sparql.setReturnFormat(JSON)
+        body = self.sparql.query().response.read()
+        self.last_response_bytes = len(body)
+        return json.loads(body.decode("utf-8"))
+
+    def iter_query(self, query):
+        """
+        Runs a sparql query against the endpoint, asking for tab separated results and parsing each row as it
+        arrives instead of reading the whole response first
+        :param query: The query to be run
+        :return: Returns a generator of the bindings of each row, in the SPARQL 1.1 JSON results format
+        """
+        self.sparql.setQuery(query)
+        self.sparql.setReturnFormat(TSV)
+        response = self.sparql.query().response
+        try:
+            header = response.readline()
+            size = len(header)
+            variables = [variable[1:] for variable in _tsv_fields(header)]
+            for line in response:
+                size += len(line)
+                binding = {}
+                for variable, term in zip(variables, _tsv_fields(line)):
+                    if term:
+                        binding[variable] = _tsv_term(term)
+                yield binding
+            self.last_response_bytes = size
+        finally:
+            response.close()
+
+    def graph_version(self, sparql_graph_name) -> str:
+        """
+        Returns a token which changes whenever the graph changes: the ETag the graph store sends for the graph,
+        or the number of triples in the graph if it does not send one
+        :rtype : str
+        :param sparql_graph_name: The name of the graph
+        :return: Returns the version token
+        """
+        request = Request("{0:s}?graph={1:s}".format(self.sparql_endpoint, quote(sparql_graph_name, safe="")),
+                          method="HEAD")
+        try:
+            with urlopen(request) as response:
+                etag = response.headers.get("ETag")
+            if etag:
+                return "etag:" + etag
+        except OSError:
+            pass
+        result = self.query("SELECT (COUNT(*) AS ?triples) FROM <{0:s}> WHERE {{ ?s ?p ?o }}".format(
+            sparql_graph_name))
+        return "count:" + result["results"]["bindings"][0]["triples"]["value"]
+
+
+class LocalGraphSource:
+    """
+    Answers the converter's queries in-process from a Knoholem dump loaded into a local rdflib store.
+    Calls to query and iter_query from several threads are run one at a time
+    """
+
+    def __init__(self, filename, sparql_graph_name, rdf_format=None):
+        """
+        :param filename: The path of the Knoholem dump (Turtle, N-Triples, RDF/XML, ...)
+        :param sparql_graph_name: The name the queries use for the input graph, the dump is loaded into this graph
+        :param rdf_format: The rdflib format name of the dump. Leave empty to guess it from the file extension
+        """
+        if rdf_format is None:
+            rdf_format = guess_format(filename) or "turtle"
+        self.dataset = Dataset()
+        self.dataset.graph(URIRef(sparql_graph_name)).parse(filename, format=rdf_format)
+        self._lock = threading.Lock()
+
+    def graph_version(self, sparql_graph_name) -> str:
+        """
+        :rtype : str
+        :param sparql_graph_name: The name of the graph
+        :return: Returns the number of triples in the graph, as a token of its version
+        """
+        return "count:{0:d}".format(len(self.dataset.graph(URIRef(sparql_graph_name))))
+
+    def query(self, query) -> dict:
+        """
+        Runs a sparql query against the local store
+        :rtype : dict
+        :param query: The query to be run
+        :return: Returns a dict in the SPARQL 1.1 JSON results format, as an endpoint would
+        """
+        with self._lock:
+            result = self.dataset.query(query)
+            variables = [str(var) for var in result.vars]
+            bindings = []
+            for row in result:
+                binding = {}
+                for var, term in zip(variables, row):
+                    if term is not None:
+                        binding[var] = self._term_to_json(term)
+                bindings.append(binding)
+        return {"head": {"vars": variables}, "results": {"bindings": bindings}}
+
+    def iter_query(self, query):
+        """
+        Runs a sparql query against the local store, converting each row only when it is asked for.
+        The store is only read under the lock, one row at a time, so other queries can run while the rows are used
+        :param query: The query to be run
+        :return: Returns a generator of the bindings of each row, in the SPARQL 1.1 JSON results format
+        """
+        with self._lock:
+            result = self.dataset.query(query)
+            variables = [str(var) for var in result.vars]
+            rows = iter(result)
+        while True:
+            with self._lock:
+                row = next(rows, None)
+            if row is None:
+                return
+            yield {var: self._term_to_json(term) for var, term in zip(variables, row) if term is not None}
+
+    @staticmethod
+    def _term_to_json(term) -> dict:
+        """
+        Converts an rdflib term to its SPARQL 1.1 JSON results representation
+        :rtype : dict
+        :param term: The URIRef, Literal or BNode to be converted
+        :return: Returns a dict with the type and value of the term
+        """
+        if isinstance(term, Literal):
+            out = {"type": "literal", "value": str(term)}
+            if term.language is not None:
+                out["xml:lang"] = term.language
+            elif term.datatype is not None:
+                out["datatype"] = str(term.datatype)
+            return out
+        if isinstance(term, BNode):
+            return {"type": "bnode", "value": str(term)}
+        return {"type": "uri", "value": str(term)}
+
+
+def _tsv_fields(line) -> list:
+    """
+    :rtype : list
+    :param line: A line of a SPARQL 1.1 TSV results response, as bytes
+    :return: Returns the fields of the line
+    """
+    return line.decode("utf-8").rstrip("\r\n").split("\t")
+
+
+def _tsv_unescape(text) -> str:
+    """
+    :rtype : str
+    :param text: The body of an IRI or literal in a TSV results response
+    :return: Returns the text with its backslash escapes replaced by the characters they stand for
+    """
+    if "\\" not in text:
+        return text
+
+    def replace(match):
+        escape = match.group(1)
+        if escape[0] in "uU" and len(escape) > 1:
+            return chr(int(escape[1:], 16))
+        return _tsv_escapes.get(escape, escape)
+
+    return _tsv_escape.sub(replace, text)
+
+
+def _tsv_term(term) -> dict:
+    """
+    Converts a term of a TSV results response, which is written in Turtle syntax, to its SPARQL 1.1 JSON results
+    representation
+    :rtype : dict
+    :param term: The term to be converted
+    :return: Returns a dict with the type and value of the term
+    """
+    if term[0] == "<":
+        return {"type": "uri", "value": _tsv_unescape(term[1:-1])}
+    if term.startswith("_:"):
+        return {"type": "bnode", "value": term[2:]}
+    match = _tsv_literal.match(term)
+    if match is not None:
+        value, language, datatype = match.groups()
+        out = {"type": "literal", "value": _tsv_unescape(value)}
+        if language is not None:
+            out["xml:lang"] = language
+        elif datatype is not None:
+            out["datatype"] = _tsv_unescape(datatype)
+        return out
+    # Numbers and booleans may be written without quotes or a datatype, as in Turtle
+    if term in ("true", "false"):
+        datatype = "boolean"
+    elif "e" in term or "E" in term:
+        datatype = "double"
+    elif "." in term:
+        datatype = "decimal"
+    else:
+        datatype = "integer"
+    return {"type": "literal", "value": term, "datatype": XSD + datatype}
@@ -0,0 +1,62 @@
+import threading
+import unittest
+from urllib.error import HTTPError
+
+from KnoholemAsync import AsyncQueryExecutor
+
+__author__ = 'Diarmuid Ryan'
+
+
+class FlakySource:
+    """
+    A source failing the first queries it is sent with the given errors, and answering every later query with
+    the query text
+    """
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.queries = 0
+        self._lock = threading.Lock()
+
+    def query(self, query):
+        with self._lock:
+            self.queries += 1
+            error = self.errors.pop(0) if self.errors else None
+        if error is not None:
+            raise error
+        return {"head": {"vars": []}, "results": {"bindings": [{"q": {"type": "literal", "value": query}}]}}
+
+
+class AsyncQueryExecutorTest(unittest.TestCase):
+
+    def test_results_are_in_query_order(self):
+        executor = AsyncQueryExecutor(FlakySource([]), concurrency=4)
+        try:
+            results = executor.run([str(index) for index in range(20)])
+        finally:
+            executor.close()
+        self.assertEqual([result["results"]["bindings"][0]["q"]["value"] for result, seconds, size in results],
+                         [str(index) for index in range(20)])
+
+    def test_failed_queries_are_retried(self):
+        source = FlakySource([IOError("reset"), HTTPError("http://e/", 503, "busy", {}, None)])
+        executor = AsyncQueryExecutor(source, concurrency=1, retries=2, backoff=0)
+        try:
+            self.assertEqual(len(executor.run(["a"])), 1)
+        finally:
+            executor.close()
+        self.assertEqual(source.queries, 3)
+
+    def test_client_errors_are_not_retried(self):
+        source = FlakySource([HTTPError("http://e/", 400, "bad query", {}, None)])
+        executor = AsyncQueryExecutor(source, concurrency=1, retries=2, backoff=0)
+        try:
+            with self.assertRaises(HTTPError):
+                executor.run(["a"])
+        finally:
+            executor.close()
+        self.assertEqual(source.queries, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
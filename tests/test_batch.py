@@ -0,0 +1,44 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from KnoholemBatch import load_manifest
+
+__author__ = 'Diarmuid Ryan'
+
+
+class LoadManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _load(self, manifest):
+        filename = os.path.join(self.directory, "manifest.json")
+        with open(filename, "w", encoding="utf-8") as manifest_file:
+            json.dump(manifest, manifest_file)
+        return load_manifest(filename, os.path.join(self.directory, "out"))
+
+    def test_outputs_are_filled_in(self):
+        jobs = self._load({"defaults": {"endpoint": "http://localhost:3030/ds/", "stream": True},
+                           "jobs": [{"graph": "http://a/b"}, {"graph": "http://a/c", "output_graph": "http://a/d"}]})
+        self.assertEqual(jobs[0]["output"], os.path.join(self.directory, "out", "http_a_b.nt"))
+        self.assertEqual(jobs[0]["output_graph"], "http://a/b_Ifc")
+        self.assertEqual(jobs[1]["output_graph"], "http://a/d")
+
+    def test_jobs_with_the_same_output_file_are_rejected(self):
+        with self.assertRaises(ValueError):
+            self._load([{"graph": "http://a/b", "input": "b.ttl"}, {"graph": "http://a_b", "input": "b.ttl"}])
+
+    def test_jobs_with_the_same_output_graph_are_rejected(self):
+        with self.assertRaises(ValueError):
+            self._load([{"name": "first", "graph": "http://a/b", "endpoint": "http://localhost:3030/ds/"},
+                        {"name": "second", "graph": "http://a/b", "endpoint": "http://localhost:3030/ds/"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from KnoholemCache import CachingSource
+
+__author__ = 'Diarmuid Ryan'
+
+QUERY = "SELECT ?x WHERE { ?x ?y ?z }"
+
+
+class StubSource:
+    """
+    A source answering every query with the same rows, counting the queries it is sent
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = 0
+
+    def query(self, query):
+        self.queries += 1
+        return {"head": {"vars": ["x"]}, "results": {"bindings": list(self.rows)}}
+
+    def iter_query(self, query):
+        self.queries += 1
+        yield from self.rows
+
+
+class CachingSourceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.rows = [{"x": {"type": "uri", "value": "http://example.org/" + str(index)}} for index in range(5)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_repeated_query_is_answered_from_the_cache(self):
+        source = StubSource(self.rows)
+        self.assertEqual(list(CachingSource(source, self.directory, "g", "1").iter_query(QUERY)), self.rows)
+        cache = CachingSource(source, self.directory, "g", "1")
+        self.assertEqual(list(cache.iter_query(QUERY)), self.rows)
+        self.assertEqual(cache.query(QUERY)["results"]["bindings"], self.rows)
+        self.assertEqual(source.queries, 1)
+        self.assertEqual(cache.hits, 2)
+
+    def test_cached_results_keep_their_head(self):
+        source = StubSource(self.rows)
+        self.assertEqual(CachingSource(source, self.directory, "g", "1").query(QUERY)["head"], {"vars": ["x"]})
+        result = CachingSource(source, self.directory, "g", "1").query(QUERY)
+        self.assertEqual(result, {"head": {"vars": ["x"]}, "results": {"bindings": self.rows}})
+        self.assertEqual(list(CachingSource(source, self.directory, "g", "1").iter_query(QUERY)), self.rows)
+        self.assertEqual(source.queries, 1)
+
+    def test_new_version_discards_only_its_own_graph(self):
+        unrelated = os.path.join(self.directory, "unrelated")
+        os.makedirs(unrelated)
+        first, second = StubSource(self.rows), StubSource(self.rows)
+        list(CachingSource(first, self.directory, "first", "1").iter_query(QUERY))
+        list(CachingSource(second, self.directory, "second", "1").iter_query(QUERY))
+        list(CachingSource(second, self.directory, "second", "2").iter_query(QUERY))
+        list(CachingSource(first, self.directory, "first", "1").iter_query(QUERY))
+        list(CachingSource(second, self.directory, "second", "1").iter_query(QUERY))
+        self.assertTrue(os.path.isdir(unrelated))
+        self.assertEqual(first.queries, 1)
+        self.assertEqual(second.queries, 3)
+
+    def test_eviction_spares_results_still_being_read(self):
+        source = StubSource(self.rows)
+        cache = CachingSource(source, self.directory, "g", "1", max_bytes=1000)
+        rows = []
+        for index, binding in enumerate(cache.iter_query(QUERY)):
+            rows.append(binding)
+            for query in range(5):
+                cache.query("SELECT ?x WHERE {{ ?x ?y {0:d} }}".format(index * 5 + query))
+        self.assertEqual(rows, self.rows)
+        list(cache.iter_query(QUERY))
+        self.assertEqual(cache.hits, 1)
+
+    def test_unfinished_results_are_not_kept(self):
+        source = StubSource(self.rows)
+        rows = CachingSource(source, self.directory, "g", "1").iter_query(QUERY)
+        next(rows)
+        rows.close()
+        list(CachingSource(source, self.directory, "g", "1").iter_query(QUERY))
+        self.assertEqual(source.queries, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+
+from rdflib import Graph
+from rdflib.compare import isomorphic
+
+from KnoholemBenchmark import generate_building, BENCHMARK_GRAPH
+from KnoholemIfc import KnoholemIfc
+from KnoholemSources import LocalGraphSource
+
+__author__ = 'Diarmuid Ryan'
+
+
+class ConversionModesTest(unittest.TestCase):
+    """
+    Every way of running the conversion must write what the serial, per-room query run writes
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        input_filename = os.path.join(cls.directory, "knoholem.ttl")
+        generate_building(input_filename, 12, 6, 3)
+        cls.source = LocalGraphSource(input_filename, BENCHMARK_GRAPH)
+        cls.serial = cls._convert("serial.n3")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    @classmethod
+    def _convert(cls, output_name, **options) -> bytes:
+        output_filename = os.path.join(cls.directory, output_name)
+        KnoholemIfc(None, BENCHMARK_GRAPH, source=cls.source, output_filename=output_filename, **options)
+        with open(output_filename, "rb") as output_file:
+            return output_file.read()
+
+    def test_bulk(self):
+        self.assertEqual(self._convert("bulk.n3", bulk=True), self.serial)
+
+    def test_workers(self):
+        self.assertEqual(self._convert("workers.n3", workers=2), self.serial)
+
+    def test_stream(self):
+        streamed = Graph()
+        streamed.parse(data=self._convert("stream.nt", bulk=True, stream=True).decode("utf-8"), format="nt")
+        serial = Graph()
+        serial.parse(data=self.serial.decode("utf-8"), format="n3")
+        self.assertTrue(isomorphic(streamed, serial))
+
+    def test_building_compact_geometry_needs_one_process(self):
+        with self.assertRaises(ValueError):
+            self._convert("compact.nt", stream=True, workers=2, compact="building")
+
+    def test_failed_write_stops_memory_tracing(self):
+        with self.assertRaises(IOError):
+            self._convert(os.path.join("missing", "out.n3"), bulk=True, trace_memory=True, profile=True)
+        self.assertFalse(tracemalloc.is_tracing())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import ThreadingHTTPServer
+
+from rdflib import Graph
+
+from KnoholemDelta import IncrementalState
+from KnoholemIfc import KnoholemIfc
+from KnoholemSources import LocalGraphSource
+from tests.test_publish import StubGraphStore
+
+__author__ = 'Diarmuid Ryan'
+
+SETTINGS = {"sparql_graph": "http://example.org/kno"}
+
+
+def triple(subject, obj):
+    return "<http://example.org/{0:s}> <http://example.org/p> <http://example.org/{1:s}> .".format(subject, obj)
+
+
+def room_graph(lines):
+    graph = Graph()
+    graph.parse(data="\n".join(lines), format="nt")
+    return graph
+
+
+class RecordingPublisher:
+    """
+    Records the requests IncrementalState.publish makes instead of sending them
+    """
+    graph_name = "http://example.org/kno_Ifc"
+    ntriples_content_type = "application/n-triples"
+
+    def __init__(self):
+        self.requests = []
+
+    def delete(self):
+        self.requests.append(("delete", None))
+
+    def post(self, data, content_type):
+        self.requests.append(("post", data.decode("utf-8")))
+
+    def update(self, update):
+        self.requests.append(("update", update))
+
+
+class IncrementalStateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "state.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _save_previous(self, rooms, settings=SETTINGS):
+        with open(self.filename, "w", encoding="utf-8") as state_file:
+            json.dump({"settings": settings, "rooms": {room_uri: {"fingerprint": room_uri + "-1",
+                                                                  "triples": sorted(lines)}
+                                                       for room_uri, lines in rooms.items()}}, state_file)
+
+    def test_removed_room_is_deleted(self):
+        self._save_previous({"a": [triple("a", "1")], "b": [triple("b", "1"), triple("b", "2")]})
+        state = IncrementalState(self.filename, SETTINGS)
+        self.assertFalse(state.full_rebuild)
+        self.assertTrue(state.is_unchanged("a", "a-1"))
+        self.assertEqual(state.changes(), ([triple("b", "1"), triple("b", "2")], []))
+
+    def test_triple_shared_with_an_unchanged_room_is_kept(self):
+        shared = triple("shared", "1")
+        self._save_previous({"a": [triple("a", "1"), shared], "b": [triple("b", "1"), shared]})
+        state = IncrementalState(self.filename, SETTINGS)
+        self.assertTrue(state.is_unchanged("b", "b-1"))
+        state.record_room("a", "a-2", room_graph([triple("a", "2"), triple("b", "1")]))
+        self.assertEqual(state.changes(), ([triple("a", "1")], [triple("a", "2")]))
+        publisher = RecordingPublisher()
+        state.publish(publisher)
+        self.assertEqual([kind for kind, body in publisher.requests], ["update", "update"])
+        self.assertTrue(publisher.requests[0][1].startswith("DELETE DATA"))
+        self.assertIn(triple("a", "1"), publisher.requests[0][1])
+        self.assertNotIn(triple("shared", "1"), publisher.requests[0][1])
+        self.assertTrue(publisher.requests[1][1].startswith("INSERT DATA"))
+
+    def test_added_room_is_inserted_in_batches(self):
+        self._save_previous({"a": [triple("a", "1")]})
+        state = IncrementalState(self.filename, SETTINGS)
+        state.update_batch_size = 2
+        self.assertTrue(state.is_unchanged("a", "a-1"))
+        added = [triple("b", str(index)) for index in range(5)]
+        state.record_room("b", "b-1", room_graph(added + [triple("a", "1")]))
+        self.assertEqual(state.changes(), ([], sorted(added)))
+        publisher = RecordingPublisher()
+        state.publish(publisher)
+        self.assertEqual(len(publisher.requests), 3)
+        self.assertTrue(all(body.startswith("INSERT DATA") for kind, body in publisher.requests))
+        self.assertEqual(sum(body.count(" .") for kind, body in publisher.requests), 5)
+
+    def test_changed_settings_force_a_rebuild(self):
+        self._save_previous({"a": [triple("a", "1")]}, dict(SETTINGS, compact="room"))
+        state = IncrementalState(self.filename, SETTINGS)
+        self.assertTrue(state.full_rebuild)
+        self.assertFalse(state.is_unchanged("a", "a-1"))
+        state.record_room("a", "a-1", room_graph([triple("a", "1")]))
+        publisher = RecordingPublisher()
+        state.publish(publisher)
+        self.assertEqual(publisher.requests, [("delete", None), ("post", triple("a", "1") + "\n")])
+
+    def test_offline_state_is_not_used_to_publish(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StubGraphStore)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        StubGraphStore.graphs = {}
+        StubGraphStore.requests = []
+        input_filename = os.path.join(self.directory, "knoholem.ttl")
+        with open(input_filename, "w", encoding="utf-8") as input_file:
+            input_file.write('@prefix knoholem: <http://www.semanticweb.org/ontologies/2012/9/knoholem.owl#> .\n'
+                             'knoholem:Room_1 a knoholem:Room ; knoholem:hasPerimeter "0:0;4:0;4:3;0:3" ;\n'
+                             '    knoholem:hasName "Room 1" .\n')
+        source = LocalGraphSource(input_filename, "http://example.org/kno")
+        try:
+            KnoholemIfc(None, "http://example.org/kno", source=source, state_filename=self.filename,
+                        output_filename=os.path.join(self.directory, "offline.nt"))
+            KnoholemIfc("http://127.0.0.1:{0:d}/ds/".format(server.server_address[1]), "http://example.org/kno",
+                        source=source, state_filename=self.filename,
+                        output_filename=os.path.join(self.directory, "online.nt"))
+        finally:
+            server.shutdown()
+            server.server_close()
+        with open(os.path.join(self.directory, "online.nt"), "rb") as output_file:
+            self.assertEqual(StubGraphStore.graphs["http://example.org/kno_Ifc"], output_file.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+import gzip
+import os
+import re
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+from KnoholemIfc import KnoholemIfc
+from KnoholemPublish import GraphStorePublisher
+from KnoholemSources import LocalGraphSource
+
+__author__ = 'Diarmuid Ryan'
+
+GRAPH = "http://example.org/kno_Ifc"
+
+
+class StubGraphStore(BaseHTTPRequestHandler):
+    """
+    A minimal SPARQL 1.1 Graph Store HTTP Protocol service keeping its graphs as N-Triples bytes in memory,
+    which also understands MOVE GRAPH updates
+    """
+    protocol_version = "HTTP/1.1"
+    graphs = {}
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def _graph(self):
+        return parse_qs(urlsplit(self.path).query).get("graph", [None])[0]
+
+    def _body(self):
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            body = b""
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                body += self.rfile.read(size)
+                self.rfile.readline()
+                if size == 0:
+                    break
+        else:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        return body
+
+    def _record(self, body=None):
+        self.requests.append({"method": self.command, "graph": self._graph(),
+                              "chunked": self.headers.get("Transfer-Encoding") == "chunked",
+                              "gzip": self.headers.get("Content-Encoding") == "gzip",
+                              "content_type": self.headers.get("Content-Type"), "body": body})
+
+    def _reply(self, status):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_PUT(self):
+        body = self._body()
+        self._record(body)
+        self.graphs[self._graph()] = body
+        self._reply(204)
+
+    def do_POST(self):
+        body = self._body()
+        self._record(body)
+        if self.headers.get("Content-Type", "").startswith("application/sparql-update"):
+            source, destination = re.match(r"MOVE GRAPH <([^>]*)> TO GRAPH <([^>]*)>", body.decode("utf-8")).groups()
+            self.graphs[destination] = self.graphs.pop(source)
+        else:
+            self.graphs[self._graph()] = self.graphs.get(self._graph(), b"") + body
+        self._reply(204)
+
+    def do_DELETE(self):
+        self._record()
+        self._reply(204 if self.graphs.pop(self._graph(), None) is not None else 404)
+
+
+class GraphStorePublisherTest(unittest.TestCase):
+
+    def setUp(self):
+        StubGraphStore.graphs = {}
+        StubGraphStore.requests = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubGraphStore)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:{0:d}/ds/".format(self.server.server_address[1])
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def test_put(self):
+        publisher = GraphStorePublisher(self.url, GRAPH)
+        publisher.put(b"<a> <b> <c> .\n", publisher.ntriples_content_type)
+        publisher.close()
+        self.assertEqual(StubGraphStore.graphs[GRAPH], b"<a> <b> <c> .\n")
+        self.assertEqual(StubGraphStore.requests[0]["content_type"], publisher.ntriples_content_type)
+
+    def test_put_file_chunked_and_gzipped(self):
+        filename = os.path.join(self.directory, "out.nt")
+        data = b"".join(b"<a> <b> \"" + str(index).encode("ascii") + b"\" .\n" for index in range(20000))
+        with open(filename, "wb") as out_file:
+            out_file.write(data)
+        publisher = GraphStorePublisher(self.url, GRAPH, compress=True)
+        publisher.put_file(filename, publisher.ntriples_content_type)
+        publisher.close()
+        self.assertTrue(StubGraphStore.requests[0]["chunked"])
+        self.assertTrue(StubGraphStore.requests[0]["gzip"])
+        self.assertEqual(StubGraphStore.graphs[GRAPH], data)
+
+    def test_batched_posts_replace_the_graph_at_close(self):
+        StubGraphStore.graphs[GRAPH] = b"<old> <old> <old> .\n"
+        publisher = GraphStorePublisher(self.url, GRAPH, compress=True, batch_size=100)
+        publisher.start()
+        lines = [b"<s> <p> \"" + str(index).encode("ascii") + b"\" .\n" for index in range(30)]
+        for line in lines:
+            publisher.write_ntriples(line)
+        self.assertEqual(StubGraphStore.graphs[GRAPH], b"<old> <old> <old> .\n")
+        publisher.close()
+        posts = [request for request in StubGraphStore.requests
+                 if request["method"] == "POST" and request["graph"] == publisher.staging_graph_name]
+        self.assertGreater(len(posts), 1)
+        self.assertTrue(all(request["gzip"] for request in posts))
+        self.assertEqual(StubGraphStore.graphs[GRAPH], b"".join(lines))
+        self.assertNotIn(publisher.staging_graph_name, StubGraphStore.graphs)
+
+    def test_abort_leaves_the_graph(self):
+        StubGraphStore.graphs[GRAPH] = b"<old> <old> <old> .\n"
+        publisher = GraphStorePublisher(self.url, GRAPH, batch_size=10)
+        publisher.start()
+        publisher.write_ntriples(b"<s> <p> <o> .\n")
+        publisher.abort()
+        self.assertEqual(StubGraphStore.graphs, {GRAPH: b"<old> <old> <old> .\n"})
+
+    def test_failed_streaming_conversion_leaves_the_graph(self):
+        input_filename = os.path.join(self.directory, "knoholem.ttl")
+        with open(input_filename, "w", encoding="utf-8") as input_file:
+            input_file.write('@prefix knoholem: <http://www.semanticweb.org/ontologies/2012/9/knoholem.owl#> .\n'
+                             'knoholem:Room_1 a knoholem:Room ; knoholem:hasPerimeter "0:0;4:0;4:x;" ;\n'
+                             '    knoholem:hasName "Room 1" .\n')
+        StubGraphStore.graphs[GRAPH] = b"<old> <old> <old> .\n"
+        with self.assertRaises(ValueError):
+            KnoholemIfc(self.url, "http://example.org/kno", stream=True,
+                        source=LocalGraphSource(input_filename, "http://example.org/kno"),
+                        output_filename=os.path.join(self.directory, "out.nt"))
+        self.assertEqual(StubGraphStore.graphs, {GRAPH: b"<old> <old> <old> .\n"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from KnoholemSources import LocalGraphSource, XSD, _tsv_fields, _tsv_term, _tsv_unescape
+
+__author__ = 'Diarmuid Ryan'
+
+GRAPH = "http://example.org/kno"
+QUERY = "SELECT ?s WHERE {{ GRAPH <{0:s}> {{ ?s ?p ?o }} }} ORDER BY ?s".format(GRAPH)
+
+
+class LocalGraphSourceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        filename = os.path.join(self.directory, "knoholem.nt")
+        with open(filename, "w", encoding="utf-8") as dump:
+            for index in range(10):
+                dump.write("<http://example.org/{0:d}> <http://example.org/p> \"{0:d}\" .\n".format(index))
+        self.source = LocalGraphSource(filename, GRAPH)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_iter_query_matches_query(self):
+        self.assertEqual(list(self.source.iter_query(QUERY)), self.source.query(QUERY)["results"]["bindings"])
+
+    def test_other_queries_run_while_rows_are_used(self):
+        expected = self.source.query(QUERY)["results"]["bindings"]
+        rows = []
+        for binding in self.source.iter_query(QUERY):
+            rows.append(binding)
+            other = []
+            thread = threading.Thread(target=lambda: other.append(self.source.query(QUERY)))
+            thread.start()
+            thread.join(10)
+            self.assertEqual(other[0]["results"]["bindings"], expected)
+        self.assertEqual(rows, expected)
+
+
+
+class TsvTermTest(unittest.TestCase):
+
+    def test_fields(self):
+        self.assertEqual(_tsv_fields(b'<http://example.org/a>\t\t"b"\r\n'), ["<http://example.org/a>", "", '"b"'])
+
+    def test_unescape(self):
+        self.assertEqual(_tsv_unescape("plain"), "plain")
+        self.assertEqual(_tsv_unescape(r"a\tb\nc\rd\be\ff"), "a\tb\nc\rd\be\ff")
+        self.assertEqual(_tsv_unescape(r'\"quoted\" \\ \''), '"quoted" \\ \'')
+        self.assertEqual(_tsv_unescape(r"caf\u00e9 \U0001F600"), "caf\u00e9 \U0001F600")
+        self.assertEqual(_tsv_unescape(r"\u12"), "u12")
+
+    def test_uri(self):
+        self.assertEqual(_tsv_term("<http://example.org/a>"), {"type": "uri", "value": "http://example.org/a"})
+        self.assertEqual(_tsv_term(r"<http://example.org/\u00e9>"),
+                         {"type": "uri", "value": "http://example.org/\u00e9"})
+
+    def test_bnode(self):
+        self.assertEqual(_tsv_term("_:b0"), {"type": "bnode", "value": "b0"})
+
+    def test_plain_literal(self):
+        self.assertEqual(_tsv_term(r'"Room \"1\"\tA"'), {"type": "literal", "value": 'Room "1"\tA'})
+        self.assertEqual(_tsv_term('""'), {"type": "literal", "value": ""})
+
+    def test_language_literal(self):
+        self.assertEqual(_tsv_term('"Salle"@fr-BE'), {"type": "literal", "value": "Salle", "xml:lang": "fr-BE"})
+        self.assertEqual(_tsv_term('"a"@en"@de'), {"type": "literal", "value": 'a"@en', "xml:lang": "de"})
+
+    def test_typed_literal(self):
+        self.assertEqual(_tsv_term('"0:0;4:0"^^<' + XSD + 'string>'),
+                         {"type": "literal", "value": "0:0;4:0", "datatype": XSD + "string"})
+
+    def test_unquoted_numbers_and_booleans(self):
+        self.assertEqual(_tsv_term("42"), {"type": "literal", "value": "42", "datatype": XSD + "integer"})
+        self.assertEqual(_tsv_term("-4.5"), {"type": "literal", "value": "-4.5", "datatype": XSD + "decimal"})
+        self.assertEqual(_tsv_term("1.5E3"), {"type": "literal", "value": "1.5E3", "datatype": XSD + "double"})
+        self.assertEqual(_tsv_term("2e-1"), {"type": "literal", "value": "2e-1", "datatype": XSD + "double"})
+        self.assertEqual(_tsv_term("true"), {"type": "literal", "value": "true", "datatype": XSD + "boolean"})
+        self.assertEqual(_tsv_term("false"), {"type": "literal", "value": "false", "datatype": XSD + "boolean"})
+
+
+if __name__ == "__main__":
+    unittest.main()